@@ -1,14 +1,23 @@
-from flask import Flask, render_template, request, redirect, flash, jsonify, url_for, send_file
+from flask import Flask, render_template, request, redirect, flash, jsonify, url_for, send_file, Response, stream_with_context
 import os
+import json
+import shutil
 from works import create_dash_app
 from werkzeug.utils import secure_filename
-from data_config import get_dataset_path, fetch_enrollment_records_from_csv, fetch_summary_data_from_csv
-from data_cleaning import clean_data
+from data_config import record_filters, project_record_columns, select_record_positions, encode_cursor, decode_cursor
+from cleaning_cache import save_upload, clean_with_cache
 from datetime import datetime
 from report import create_dash_app_report
+from dataset_store import publish_dataset, activate_version, current_version
+from dataset_backend import get_backend
+from static_assets import init_static_assets
+from watchlist import build_watchlist_bitsets
+from rollups import build_rollups, summary_data
 
 app = Flask(__name__)
 app.secret_key = 'secret123'
+# gzip/brotli responses, immutable caching for fingerprinted static files
+init_static_assets(app)
 
 # Upload folder config
 UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'static')
@@ -17,6 +26,11 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(CLEANED_FOLDER, exist_ok=True)
 ALLOWED_EXTENSIONS = {'csv'}
 
+# Records API paging
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+STREAM_CHUNK_ROWS = 5000
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -87,22 +101,43 @@ def upload():
             return redirect(request.url)
 
         if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            raw_path = os.path.join(UPLOAD_FOLDER, 'temp_' + filename)
-            file.save(raw_path)
+            raw_path, digest = save_upload(file, UPLOAD_FOLDER)
 
             try:
-                cleaned_path = clean_data(raw_path)
-                os.replace(cleaned_path, dataset_path)
-                os.remove(raw_path)
-
-                flash('File cleaned and uploaded successfully! It is now the active dataset.')
+                cleaned_path, was_cached = clean_with_cache(raw_path, digest)
+                # Parse and index once here, before the swap, so the other workers attach to a
+                # version whose database and rollups are already built
+                version = publish_dataset(cleaned_path, activate=False)
+                get_backend().prepare(version)
+                build_rollups(version)
+                try:
+                    build_watchlist_bitsets(version)
+                    watchlist_error = None
+                except Exception as e:
+                    # The upload still goes live; the report just shows no watchlist for it
+                    watchlist_error = e
+
+                # Copy, not move, so the cached result can be reused by the next identical upload
+                temp_dataset_path = f"{dataset_path}.{os.getpid()}.tmp"
+                shutil.copyfile(cleaned_path, temp_dataset_path)
+                os.replace(temp_dataset_path, dataset_path)
+                activate_version(version, dataset_path)
+
+                if was_cached:
+                    flash('This file was already cleaned, so the saved result was reused. It is now the active dataset.')
+                else:
+                    flash('File cleaned and uploaded successfully! It is now the active dataset.')
+                if watchlist_error is not None:
+                    flash(f"The watchlist rules could not be evaluated for this dataset: {watchlist_error}")
                 last_updated = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
             except Exception as e:
                 flash(f"Data cleaning failed: {str(e)}")
                 return redirect(request.url)
 
+            finally:
+                os.remove(raw_path)
+
             return render_template("upload.html", last_updated=last_updated)
 
         flash("Invalid file type. Please upload a .csv file.")
@@ -116,17 +151,19 @@ def clean():
         uploaded_file = request.files.get('uncleaned_file')
         if uploaded_file and uploaded_file.filename != '':
             filename = secure_filename(uploaded_file.filename)
-            raw_path = os.path.join(CLEANED_FOLDER, filename)
-            uploaded_file.save(raw_path)
+            raw_path, digest = save_upload(uploaded_file, UPLOAD_FOLDER)
 
             try:
-                cleaned_path = clean_data(raw_path)
-                return send_file(cleaned_path, as_attachment=True)
+                cleaned_path, _ = clean_with_cache(raw_path, digest)
+                return send_file(cleaned_path, as_attachment=True, download_name=f"cleaned_{filename}")
 
             except Exception as e:
                 flash(f"Data cleaning failed: {str(e)}")
                 return redirect(request.url)
 
+            finally:
+                os.remove(raw_path)
+
         flash("No valid file selected for cleaning.")
         return redirect(request.url)
 
@@ -135,11 +172,55 @@ def clean():
 @app.route('/api/enrollment_data')
 @app.route('/api/enrollment_data')
 def get_enrollment_data():
-    file_path = get_dataset_path()
-    data = fetch_enrollment_records_from_csv(file_path)
-    data = fetch_summary_data_from_csv(file_path)
+    data = summary_data()
     return jsonify(data)
 
+@app.route('/api/enrollment_records')
+def get_enrollment_records():
+    """
+    Query string: columns=a,b,c  region=  division=  sector=  grade=  limit=  cursor=
+    format=ndjson streams one record per line instead of a JSON page. Rows are
+    encoded with pandas' C JSON writer, never as Python dicts.
+    """
+    backend = get_backend()
+    version = current_version() or ''
+    args = request.args
+
+    try:
+        columns = [col.strip() for col in args['columns'].split(',') if col.strip()] if args.get('columns') else None
+        columns = project_record_columns(backend.columns(), columns, args.get('grade'))
+        filters = {param: args[param] for param in record_filters if args.get(param)}
+        after = decode_cursor(args['cursor'], version) if args.get('cursor') else None
+        positions = select_record_positions(backend, filters, after)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    streaming = args.get('format') == 'ndjson'
+    limit = args.get('limit', type=int)
+    if limit is None and not streaming:
+        limit = DEFAULT_PAGE_SIZE
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    page = positions[:limit] if limit is not None else positions
+    next_cursor = encode_cursor(version, int(page[-1])) if len(page) < len(positions) else None
+
+    if streaming:
+        def generate():
+            for start in range(0, len(page), STREAM_CHUNK_ROWS):
+                chunk = backend.rows_at(page[start:start + STREAM_CHUNK_ROWS], columns)
+                yield chunk.to_json(orient='records', lines=True).rstrip('\n') + '\n'
+
+        response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        response.headers['X-Dataset-Version'] = version
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
+
+    records = backend.rows_at(page, columns).to_json(orient='records')
+    body = '{"version":%s,"count":%d,"next_cursor":%s,"records":%s}' % (json.dumps(version), len(page), json.dumps(next_cursor), records)
+    return Response(body, mimetype='application/json')
+
 @app.route('/rerun_app', methods=['POST'])
 def rerun_app():
     print("Rerunning the Flask application (simulated).")
@@ -0,0 +1,93 @@
+import os
+import time
+import shutil
+import uuid
+import hashlib
+from werkzeug.utils import secure_filename
+from data_cleaning import clean_data, cleaner_version
+
+# Cleaned outputs are stored under the SHA-256 of the uploaded bytes plus the cleaner
+# version, so re-submitting the same file returns the earlier result immediately.
+CACHE_DIRECTORY = os.path.join(os.path.dirname(__file__), 'cleaned_files')
+CACHE_MAX_BYTES = 500 * 1024 * 1024
+CACHE_MAX_AGE_SECONDS = 30 * 24 * 60 * 60
+# Checkpoints of cleans that failed part way, kept so a re-upload can resume
+WORK_DIR_MAX_AGE_SECONDS = 24 * 60 * 60
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+def save_upload(file_storage, directory):
+    """
+    Stream an uploaded file to disk, hashing it on the way. Returns (path, digest).
+    The temporary name is unique, so concurrent uploads of the same filename don't clash.
+    """
+    os.makedirs(directory, exist_ok=True)
+    raw_path = os.path.join(directory, f"temp_{uuid.uuid4().hex[:8]}_{secure_filename(file_storage.filename)}")
+    digest = hashlib.sha256()
+    with open(raw_path, 'wb') as f:
+        for chunk in iter(lambda: file_storage.stream.read(UPLOAD_CHUNK_BYTES), b''):
+            digest.update(chunk)
+            f.write(chunk)
+    return raw_path, digest.hexdigest()
+
+
+def cache_key(digest):
+    return f"{digest[:32]}-{cleaner_version()}"
+
+
+def _touch_entry(key):
+    # Files of one entry (the cleaned CSV and its reports) share the key prefix
+    now = time.time()
+    for name in os.listdir(CACHE_DIRECTORY):
+        if name.startswith(key):
+            os.utime(os.path.join(CACHE_DIRECTORY, name), (now, now))
+
+
+def clean_with_cache(raw_path, digest):
+    """
+    Return the cleaned CSV for an upload, running clean_data only on a cache miss.
+    Returns (cleaned_path, was_cached).
+    """
+    os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+    key = cache_key(digest)
+    cleaned_path = os.path.join(CACHE_DIRECTORY, f"{key}.csv")
+
+    if os.path.exists(cleaned_path):
+        _touch_entry(key)
+        return cleaned_path, True
+
+    clean_data(raw_path, cleaned_path, work_dir=os.path.join(CACHE_DIRECTORY, f"{key}.work"), source_id=key)
+    evict_cleaned_files(keep=key)
+    return cleaned_path, False
+
+
+def evict_cleaned_files(keep=None):
+    """
+    Remove cleaned files older than CACHE_MAX_AGE_SECONDS, then the least recently
+    used ones until the folder is under CACHE_MAX_BYTES. The entry just written is kept.
+    """
+    now = time.time()
+    entries = []
+    for name in os.listdir(CACHE_DIRECTORY):
+        path = os.path.join(CACHE_DIRECTORY, name)
+        if name.endswith('.work') and name != f"{keep}.work" and now - os.path.getmtime(path) > WORK_DIR_MAX_AGE_SECONDS:
+            shutil.rmtree(path, ignore_errors=True)
+            continue
+        if not os.path.isfile(path) or name.endswith('.tmp') or (keep and name.startswith(keep)):
+            continue
+        stat = os.stat(path)
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total_bytes = sum(size for _, size, _ in entries)
+    if keep:
+        total_bytes += sum(os.path.getsize(os.path.join(CACHE_DIRECTORY, name))
+                           for name in os.listdir(CACHE_DIRECTORY) if name.startswith(keep))
+
+    for mtime, size, path in sorted(entries):
+        if now - mtime <= CACHE_MAX_AGE_SECONDS and total_bytes <= CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            total_bytes -= size
+        except FileNotFoundError:
+            pass
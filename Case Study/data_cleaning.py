@@ -1,8 +1,61 @@
 import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import numpy as np
 import pandas as pd
 from datetime import datetime
 import re
 from difflib import get_close_matches
+from data_config import non_enrollment_cols
+
+# Changes whenever this module changes, so cached cleaning results from an older
+# cleaner are never reused
+with open(__file__, 'rb') as _source:
+    CLEANER_VERSION = hashlib.sha1(_source.read()).hexdigest()[:8]
+
+# Thresholds for rejecting school rows; the file overrides these defaults
+VALIDATION_RULES_PATH = os.path.join(os.path.dirname(__file__), 'validation_rules.json')
+default_validation_rules = {
+    'max_count': 5000,
+    'max_count_by_column': {},
+    'reject_negative': True,
+    'reject_non_integer': True,
+    'reject_blank': True,
+    'reject_non_numeric': True,
+}
+
+# One bit per rule in the per-row validation mask
+VALIDATION_NEGATIVE = 1
+VALIDATION_NON_INTEGER = 2
+VALIDATION_ABOVE_MAX = 4
+VALIDATION_BLANK = 8
+VALIDATION_NON_NUMERIC = 16
+validation_reasons = {
+    VALIDATION_NEGATIVE: 'negative count',
+    VALIDATION_NON_INTEGER: 'fractional count',
+    VALIDATION_ABOVE_MAX: 'count above maximum',
+    VALIDATION_BLANK: 'blank count',
+    VALIDATION_NON_NUMERIC: 'not a number',
+}
+
+
+def load_validation_rules():
+    rules = dict(default_validation_rules)
+    try:
+        with open(VALIDATION_RULES_PATH) as f:
+            rules.update(json.load(f))
+    except FileNotFoundError:
+        pass
+    return rules
+
+
+def cleaner_version():
+    # The code, the shared column list and the validation thresholds together decide what a clean produces
+    rules = json.dumps([load_validation_rules(), non_enrollment_cols], sort_keys=True)
+    return hashlib.sha1(f"{CLEANER_VERSION}:{rules}".encode()).hexdigest()[:8]
 
 standard_columns = [
     "K Male", "K Female", "G1 Male", "G1 Female", "G2 Male", "G2 Female", "G3 Male", "G3 Female",
@@ -61,126 +114,444 @@ def standardize_column_name(col):
     return match[0] if match else col
 
 
-def clean_data(file_path):
-    df = pd.read_csv(file_path, header=None)
-    cleaned_files_directory = os.path.join(os.path.dirname(__file__), 'cleaned_files')
-    os.makedirs(cleaned_files_directory, exist_ok=True)
-
-    # Detect header row
-    potential_headers = ['Region', 'Kindergarten', 'Grade 1', 'Grade 2', 'G1', 'G2']
-    header_row_index = None
-
-    for idx, row in df.iterrows():
+# Cells that mean "no learners" in the source sheets; parsed as 0 without being reported
+blank_count_markers = ['', '-', 'nan', 'none']
+
+def parse_enrollment_counts(df_block):
+    """
+    Convert a block of enrollment cells to ints in one vectorized pass over all cells.
+    Thousands separators and surrounding spaces are accepted; blanks and dashes become 0.
+    Anything else that cannot be parsed is also set to 0 but returned in the coerced
+    report (row label, column, original value) instead of being dropped silently.
+    """
+    values = df_block.to_numpy(dtype=object).ravel()
+    cells = pd.Series(values)
+
+    # Fast path: plain numbers and numeric strings parse directly
+    counts = pd.to_numeric(cells, errors='coerce')
+
+    # Slow path only for the cells that failed: strip separators, then retry
+    failed = counts.isna()
+    if failed.any():
+        text = cells[failed].astype(str).str.replace(',', '', regex=False).str.strip()
+        counts[failed] = pd.to_numeric(text, errors='coerce')
+        placeholder = text.str.lower().isin(blank_count_markers)
+        coerced = counts.isna() & ~placeholder.reindex(counts.index, fill_value=False)
+    else:
+        coerced = failed
+
+    n_rows, n_cols = df_block.shape
+    coerced_positions = np.flatnonzero(coerced.to_numpy())
+    coerced_report = pd.DataFrame({
+        'Row': df_block.index.to_numpy()[coerced_positions // n_cols],
+        'Column': df_block.columns.to_numpy()[coerced_positions % n_cols],
+        'Value': values[coerced_positions],
+    })
+
+    parsed = counts.fillna(0).to_numpy().astype(int).reshape(n_rows, n_cols)
+    return pd.DataFrame(parsed, index=df_block.index, columns=df_block.columns), coerced_report
+
+# Column header keywords that mark the header row of an enrollment sheet
+potential_headers = ['Region', 'Kindergarten', 'Grade 1', 'Grade 2', 'G1', 'G2']
+
+school_text_replacements = {
+    r'\bES\b': 'ELEMENTARY SCHOOL', 'E/S': 'ELEMENTARY SCHOOL', r'\bELEM.\b': 'ELEMENTARY SCHOOL',
+    r'\bNHS\b': 'NATIONAL HIGH SCHOOL', r'\bHS\b': 'HIGH SCHOOL', r'\bCES\b': 'CENTRAL ELEMENTARY SCHOOL',
+    r'\bSCH.\b': 'SCHOOL', 'Incorporated': 'INC.', r'\bMEM.\b': 'MEMORIAL',
+    r'\bCS\b': 'CENTRAL SCHOOL', r'\bPS\b': 'PRIMARY SCHOOL', 'P/S': 'PRIMARY SCHOOL',
+    r'\bLC\b': 'LEARNING CENTER', 'BARANGAY': 'BRGY. ', 'POBLACION': 'POB. ',
+    'STREET': 'ST. ', 'BUILDING': 'BLDG. ', 'BLOCK': 'BLK. ', 'PUROK': 'PRK. ',
+    'AVENUE': 'AVE. ', 'ROAD': 'RD. ', 'PACKAGE': 'PKG. ', 'PHASE': 'PH. ',
+    r'\s*,\s*': ', ', r'\s{2,}': ' '
+}
+
+
+class CleaningArtifacts:
+    """
+    What the cleaning stages hand to each other. Each stage reads some of these
+    attributes and sets others; CleaningStage.produces declares which, and of what type.
+    """
+
+    def __init__(self, file_path, source_id):
+        self.file_path = file_path
+        self.source_id = source_id       # identifies the input when resuming
+        self.raw = None                  # the file as read, without a header
+        self.header_row_index = None     # position of the header row in raw
+        self.layout = None               # 'school' or 'regional'
+        self.table = None                # the frame being cleaned
+        self.enrollment_cols = None
+        self.rejected_rows = pd.DataFrame()
+        self.coerced_cells = pd.DataFrame()
+        self.cleaned_path = None
+        self.attempt_dir = None          # this run's checkpoint folder inside work_dir
+        self.completed = []              # names of the stages that have run
+        self.timings = []                # (stage, seconds, 'ran' | 'skipped' | 'resumed')
+
+
+class CleaningStage:
+    def __init__(self, name, run, produces, layouts=('school', 'regional')):
+        self.name = name
+        self.run = run
+        self.produces = produces
+        self.layouts = layouts
+
+    def applies_to(self, artifacts):
+        return artifacts.layout is None or artifacts.layout in self.layouts
+
+    def check_outputs(self, artifacts):
+        for attribute, expected in self.produces.items():
+            value = getattr(artifacts, attribute)
+            if not isinstance(value, expected):
+                raise TypeError(f"Cleaning stage '{self.name}' produced {attribute} as {type(value).__name__}, expected {expected.__name__}")
+
+
+def _source_id(file_path):
+    stat = os.stat(file_path)
+    return f"{os.path.abspath(file_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def read_raw(artifacts, cleaned_path):
+    artifacts.raw = pd.read_csv(artifacts.file_path, header=None)
+
+
+def detect_header(artifacts, cleaned_path):
+    for idx, row in artifacts.raw.iterrows():
         row_values = row.astype(str).str.lower().tolist()
         if all(any(keyword.lower() in cell for cell in row_values) for keyword in ['region']) and \
            any(any(grade.lower() in cell for cell in row_values) for grade in ['kindergarten', 'grade 1', 'g1']):
-            header_row_index = idx
-            break
-
-    if header_row_index is None:
-        raise ValueError("Could not find a valid header row.")
-
-    df.columns = df.iloc[header_row_index]
-    df_cleaned = df.iloc[header_row_index + 1:].reset_index(drop=True)
-    df_cleaned = df_cleaned.apply(pd.to_numeric, errors='ignore')
-
-    is_school_level = 'School Name' in df_cleaned.columns and 'BEIS School ID' in df_cleaned.columns
-
-    if is_school_level:
-        # School-level logic
-        special_cases = {
-            r'\bES\b': 'ELEMENTARY SCHOOL', 'E/S': 'ELEMENTARY SCHOOL', r'\bELEM.\b': 'ELEMENTARY SCHOOL',
-            r'\bNHS\b': 'NATIONAL HIGH SCHOOL', r'\bHS\b': 'HIGH SCHOOL', r'\bCES\b': 'CENTRAL ELEMENTARY SCHOOL',
-            r'\bSCH.\b': 'SCHOOL', 'Incorporated': 'INC.', r'\bMEM.\b': 'MEMORIAL',
-            r'\bCS\b': 'CENTRAL SCHOOL', r'\bPS\b': 'PRIMARY SCHOOL', 'P/S': 'PRIMARY SCHOOL',
-            r'\bLC\b': 'LEARNING CENTER', 'BARANGAY': 'BRGY. ', 'POBLACION': 'POB. ',
-            'STREET': 'ST. ', 'BUILDING': 'BLDG. ', 'BLOCK': 'BLK. ', 'PUROK': 'PRK. ',
-            'AVENUE': 'AVE. ', 'ROAD': 'RD. ', 'PACKAGE': 'PKG. ', 'PHASE': 'PH. ',
-            r'\s*,\s*': ', ', r'\s{2,}': ' '
-        }
-
-        columns_to_format = ['School Name', 'Street Address', 'Province', 'Municipality', 'Barangay']
-        df_cleaned[columns_to_format] = df_cleaned[columns_to_format].apply(
-            lambda x: x.str.replace('#', '', regex=False)
-                        .str.replace(r'^[-:]', '', regex=True)
-                        .str.strip()
-                        .str.upper()
-                        .replace(special_cases, regex=True)
-        )
-
-        columns_to_format = ['Street Address', 'Barangay']
-        df_cleaned[columns_to_format] = (
-            df_cleaned[columns_to_format]
-            .replace(['N/A', 'N.A.', 'N / A', 'NA', 'NONE', 'NULL', 'NOT APPLICABLE', '', '0', '_', '=', '.', '-----'], pd.NA)
-            .replace(r'^[\s\W_]+$', pd.NA, regex=True)
-            .fillna("UNKNOWN")
-        )
-
-        non_enrollment_cols = [
-            'Region', 'Division', 'District', 'BEIS School ID', 'School Name',
-            'Street Address', 'Province', 'Municipality', 'Legislative District',
-            'Barangay', 'Sector', 'School Subclassification', 'School Type', 'Modified COC'
-        ]
-
-        enrollment_cols = [col for col in df_cleaned.columns if col not in non_enrollment_cols]
-        max_threshold = 5000
-
-        unrealistic_data = df_cleaned[(
-            df_cleaned[enrollment_cols] < 0).any(axis=1) |
-            (df_cleaned[enrollment_cols] % 1 != 0).any(axis=1) |
-            (df_cleaned[enrollment_cols] > max_threshold).any(axis=1)
-        ]
-
-        df_cleaned = df_cleaned.drop(unrealistic_data.index)
+            artifacts.header_row_index = idx
+            return
+
+    raise ValueError("Could not find a valid header row.")
+
+
+def split_header(artifacts, cleaned_path):
+    df = artifacts.raw
+    header = df.iloc[artifacts.header_row_index]
+    artifacts.table = df.iloc[artifacts.header_row_index + 1:].reset_index(drop=True)
+    artifacts.table.columns = header
+    is_school_level = 'School Name' in artifacts.table.columns and 'BEIS School ID' in artifacts.table.columns
+    artifacts.layout = 'school' if is_school_level else 'regional'
+
+
+def coerce_numeric(artifacts, cleaned_path):
+    artifacts.table = artifacts.table.apply(pd.to_numeric, errors='ignore')
+    artifacts.enrollment_cols = [col for col in artifacts.table.columns if col not in non_enrollment_cols]
+
+
+def normalize_text(artifacts, cleaned_path):
+    df_cleaned = artifacts.table
+    columns_to_format = ['School Name', 'Street Address', 'Province', 'Municipality', 'Barangay']
+    df_cleaned[columns_to_format] = df_cleaned[columns_to_format].apply(
+        lambda x: x.str.replace('#', '', regex=False)
+                    .str.replace(r'^[-:]', '', regex=True)
+                    .str.strip()
+                    .str.upper()
+                    .replace(school_text_replacements, regex=True)
+    )
+
+    columns_to_format = ['Street Address', 'Barangay']
+    df_cleaned[columns_to_format] = (
+        df_cleaned[columns_to_format]
+        .replace(['N/A', 'N.A.', 'N / A', 'NA', 'NONE', 'NULL', 'NOT APPLICABLE', '', '0', '_', '=', '.', '-----'], pd.NA)
+        .replace(r'^[\s\W_]+$', pd.NA, regex=True)
+        .fillna("UNKNOWN")
+    )
+
+
+def validate_counts(df_counts, rules):
+    """
+    Check a block of enrollment cells against the validation rules in one pass over a
+    float64 matrix. Returns (cell_flags, row_mask): a uint8 matrix of the rule bits
+    each cell violates, and their OR per row (0 for a valid row).
+    """
+    n_rows, n_cols = df_counts.shape
+    # Column-major, since the matrix is filled one column at a time
+    cell_flags = np.zeros((n_rows, n_cols), dtype='uint8', order='F')
+    if not n_cols:
+        return cell_flags, np.zeros(n_rows, dtype='uint8')
+
+    # Integer columns (the usual case) cannot be blank or fractional, so those checks are skipped
+    all_integer = all(pd.api.types.is_integer_dtype(dtype) for dtype in df_counts.dtypes)
+    matrix = np.empty((n_rows, n_cols), dtype='int64' if all_integer else 'float64', order='F')
+    non_numeric = None
+    for j, col in enumerate(df_counts.columns):
+        values = df_counts[col]
+        if pd.api.types.is_numeric_dtype(values):
+            matrix[:, j] = values.to_numpy(dtype=matrix.dtype, na_value=np.nan) if not all_integer else values.to_numpy()
+        else:
+            # Columns left as text by coerce_numeric hold at least one unparseable cell
+            parsed = pd.to_numeric(values, errors='coerce')
+            matrix[:, j] = parsed.to_numpy(dtype='float64', na_value=np.nan)
+            if non_numeric is None:
+                non_numeric = np.zeros((n_rows, n_cols), dtype=bool, order='F')
+            non_numeric[:, j] = (parsed.isna() & values.notna()).to_numpy()
+
+    max_count = np.array([rules['max_count_by_column'].get(col, rules['max_count']) for col in df_counts.columns])
+    if rules['reject_negative']:
+        np.bitwise_or(cell_flags, VALIDATION_NEGATIVE, out=cell_flags, where=matrix < 0)
+    np.bitwise_or(cell_flags, VALIDATION_ABOVE_MAX, out=cell_flags, where=matrix > max_count)
+    if not all_integer:
+        missing = np.isnan(matrix)
+        if rules['reject_non_integer']:
+            np.bitwise_or(cell_flags, VALIDATION_NON_INTEGER, out=cell_flags, where=(np.trunc(matrix) != matrix) & ~missing)
+        if non_numeric is not None:
+            if rules['reject_non_numeric']:
+                np.bitwise_or(cell_flags, VALIDATION_NON_NUMERIC, out=cell_flags, where=non_numeric)
+            missing &= ~non_numeric
+        if rules['reject_blank']:
+            np.bitwise_or(cell_flags, VALIDATION_BLANK, out=cell_flags, where=missing)
+    return cell_flags, np.bitwise_or.reduce(cell_flags, axis=1)
+
+
+def _rejection_reasons(cell_flags, columns, rules):
+    # Only called for the rejected rows, so a Python loop over them is fine
+    reasons = []
+    for flags in cell_flags:
+        parts = []
+        for bit, label in validation_reasons.items():
+            cols = [col for col, flag in zip(columns, flags) if flag & bit]
+            if bit == VALIDATION_ABOVE_MAX:
+                cols = [f"{col} > {rules['max_count_by_column'].get(col, rules['max_count'])}" for col in cols]
+            if cols:
+                parts.append(f"{label}: {', '.join(cols)}")
+        reasons.append('; '.join(parts))
+    return reasons
+
+
+def validate_rows(artifacts, cleaned_path):
+    df_cleaned = artifacts.table
+    rules = load_validation_rules()
+    cell_flags, row_mask = validate_counts(df_cleaned[artifacts.enrollment_cols], rules)
+
+    rejected = np.flatnonzero(row_mask)
+    quarantine = df_cleaned.iloc[rejected].copy()
+    # Row numbers as they appear in the uploaded file (1-based, header row included)
+    quarantine.insert(0, 'Row', quarantine.index + artifacts.header_row_index + 2)
+    quarantine.insert(1, 'Reasons', _rejection_reasons(cell_flags[rejected], artifacts.enrollment_cols, rules))
+    quarantine.insert(2, 'Rule Mask', row_mask[rejected])
+
+    artifacts.rejected_rows = quarantine.reset_index(drop=True)
+    artifacts.table = df_cleaned[row_mask == 0]
+
+
+def build_regional_header(artifacts, cleaned_path):
+    # Regional sheets have a grade row and a gender row; merge them into one header
+    df_trimmed = artifacts.raw.iloc[artifacts.header_row_index:].reset_index(drop=True)
+
+    grade_row = df_trimmed.iloc[0].tolist()
+    gender_row = df_trimmed.iloc[1].tolist()
+
+    new_columns = []
+    last_valid_grade = None
+    gender_indicators = ['male', 'female', 'm', 'f']
+
+    for i in range(len(gender_row)):
+        grade = str(grade_row[i]).strip() if i < len(grade_row) else ""
+        gender = str(gender_row[i]).strip() if i < len(gender_row) else ""
+
+        if grade.lower() == 'region':
+            new_columns.append('Region')
+            continue
+
+        if grade and grade.lower() != 'nan':
+            last_valid_grade = grade
+        elif not grade or grade.lower() == 'nan':
+            grade = last_valid_grade
+
+        if gender.lower() in gender_indicators:
+            new_columns.append(f"{grade} {gender.title()}")
+        else:
+            new_columns.append(grade)
+
+    df_data = df_trimmed.iloc[2:].reset_index(drop=True)
+    df_data.columns = new_columns
+    artifacts.table = df_data.dropna(how='all')
+
+
+def standardize_columns(artifacts, cleaned_path):
+    df_cleaned = artifacts.table
+    enrollment_cols = [col for col in df_cleaned.columns if col != 'Region']
+    df_cleaned.rename(columns={col: standardize_column_name(col) for col in enrollment_cols}, inplace=True)
+    artifacts.enrollment_cols = [col for col in df_cleaned.columns if col != 'Region']
+
+
+def parse_counts(artifacts, cleaned_path):
+    df_cleaned = artifacts.table
+    parsed_counts, coerced_cells = parse_enrollment_counts(df_cleaned[artifacts.enrollment_cols])
+    artifacts.table = pd.concat([df_cleaned[['Region']], parsed_counts], axis=1)[df_cleaned.columns]
+    # Row numbers as they appear in the uploaded file (1-based, header rows included)
+    coerced_cells['Row'] = coerced_cells['Row'] + artifacts.header_row_index + 3
+    artifacts.coerced_cells = coerced_cells
+
+
+def _write_csv_atomically(frame, path):
+    # Concurrent cleans of the same upload write the same paths; readers only ever see a whole file
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    frame.to_csv(temp_path, index=False)
+    os.replace(temp_path, path)
+
+
+def write_output(artifacts, cleaned_path):
+    if cleaned_path is None:
+        cleaned_files_directory = os.path.join(os.path.dirname(__file__), 'cleaned_files')
+        os.makedirs(cleaned_files_directory, exist_ok=True)
+        # The random suffix keeps two cleans in the same second from colliding
+        cleaned_filename = f"cleaned_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}.csv"
+        cleaned_path = os.path.join(cleaned_files_directory, cleaned_filename)
+
+    if not artifacts.coerced_cells.empty:
+        coerced_path = os.path.splitext(cleaned_path)[0] + '_coerced_cells.csv'
+        _write_csv_atomically(artifacts.coerced_cells, coerced_path)
+        print(f"{len(artifacts.coerced_cells)} unparseable enrollment cells were set to 0; see {coerced_path}")
+    if not artifacts.rejected_rows.empty:
+        quarantine_path = os.path.splitext(cleaned_path)[0] + '_quarantine.csv'
+        _write_csv_atomically(artifacts.rejected_rows, quarantine_path)
+        print(f"{len(artifacts.rejected_rows)} school rows failed validation and were left out; see {quarantine_path}")
+    # Written last: the upload cache treats an existing cleaned CSV as a complete entry
+    _write_csv_atomically(artifacts.table, cleaned_path)
+    artifacts.cleaned_path = cleaned_path
+
+
+# In order. A stage whose layouts do not include the file's layout is skipped.
+cleaning_stages = [
+    CleaningStage('read_raw', read_raw, {'raw': pd.DataFrame}),
+    CleaningStage('detect_header', detect_header, {'header_row_index': int}),
+    CleaningStage('split_header', split_header, {'table': pd.DataFrame, 'layout': str}),
+    CleaningStage('coerce_numeric', coerce_numeric, {'table': pd.DataFrame, 'enrollment_cols': list}, layouts=('school',)),
+    CleaningStage('normalize_text', normalize_text, {'table': pd.DataFrame}, layouts=('school',)),
+    CleaningStage('validate_rows', validate_rows, {'table': pd.DataFrame, 'rejected_rows': pd.DataFrame}, layouts=('school',)),
+    CleaningStage('build_regional_header', build_regional_header, {'table': pd.DataFrame}, layouts=('regional',)),
+    CleaningStage('standardize_columns', standardize_columns, {'table': pd.DataFrame, 'enrollment_cols': list}, layouts=('regional',)),
+    CleaningStage('parse_counts', parse_counts, {'table': pd.DataFrame, 'coerced_cells': pd.DataFrame}, layouts=('regional',)),
+    CleaningStage('write_output', write_output, {'cleaned_path': str}),
+]
 
-    else:
-        # Regional-level logic
-        non_enrollment_cols = ['Region']
-        df_trimmed = df.iloc[header_row_index:].reset_index(drop=True)
+# Stages a validation-only pre-check runs: enough to find the header and check the counts
+validation_stages = ['read_raw', 'detect_header', 'split_header', 'coerce_numeric', 'validate_rows',
+                     'build_regional_header', 'standardize_columns', 'parse_counts']
 
-        grade_row = df_trimmed.iloc[0].tolist()
-        gender_row = df_trimmed.iloc[1].tolist()
 
-        new_columns = []
-        last_valid_grade = None
-        gender_indicators = ['male', 'female', 'm', 'f']
+def _checkpoint_path(work_dir, position, stage):
+    return os.path.join(work_dir, f"{position:02d}_{stage.name}_{cleaner_version()}.pkl")
 
-        for i in range(len(gender_row)):
-            grade = str(grade_row[i]).strip() if i < len(grade_row) else ""
-            gender = str(gender_row[i]).strip() if i < len(gender_row) else ""
 
-            if grade.lower() == 'region':
-                new_columns.append('Region')
+def _resume(source_id, work_dir):
+    # The furthest checkpoint, newest first on ties, that any earlier or concurrent run
+    # wrote with this cleaner version for this exact input, if any
+    attempts = [os.path.join(work_dir, name) for name in os.listdir(work_dir) if name.startswith('attempt_')]
+    candidates = []
+    for attempt_dir in attempts:
+        for position, stage in enumerate(cleaning_stages):
+            path = _checkpoint_path(attempt_dir, position, stage)
+            try:
+                candidates.append((position, os.path.getmtime(path), path))
+            except OSError:
                 continue
-
-            if grade and grade.lower() != 'nan':
-                last_valid_grade = grade
-            elif not grade or grade.lower() == 'nan':
-                grade = last_valid_grade
-
-            if gender.lower() in gender_indicators:
-                new_columns.append(f"{grade} {gender.title()}")
-            else:
-                new_columns.append(grade)
-
-        df_data = df_trimmed.iloc[2:].reset_index(drop=True)
-        df_data.columns = new_columns
-        df_data = df_data.dropna(how='all')
-        df_data = df_data.replace('-', '0')
-        df_cleaned = df_data
-
-        enrollment_cols = [col for col in df_cleaned.columns if col not in non_enrollment_cols]
-
-        df_cleaned.rename(columns={col: standardize_column_name(col) for col in enrollment_cols}, inplace=True)
-
-        enrollment_cols = [col for col in df_cleaned.columns if col not in non_enrollment_cols]
-
-        for col in enrollment_cols:
-            df_cleaned[col] = df_cleaned[col].astype(str).str.replace(',', '').str.strip()
-            df_cleaned[col] = pd.to_numeric(df_cleaned[col], errors='coerce').fillna(0).astype(int)
-            
-    # Save cleaned file
-    cleaned_filename = f"cleaned_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-    cleaned_path = os.path.join(cleaned_files_directory, cleaned_filename)
-    df_cleaned.to_csv(cleaned_path, index=False)
-    return cleaned_path
\ No newline at end of file
+    for _, _, path in sorted(candidates, reverse=True):
+        try:
+            artifacts = pd.read_pickle(path)
+        except FileNotFoundError:
+            continue  # the run that wrote it has moved on or finished
+        if artifacts.source_id == source_id:
+            return artifacts
+    return None
+
+
+def _save_checkpoint(artifacts, work_dir, position, stage):
+    path = _checkpoint_path(work_dir, position, stage)
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    pd.to_pickle(artifacts, temp_path)
+    os.replace(temp_path, path)
+    # Only the latest checkpoint is needed to resume
+    for name in os.listdir(work_dir):
+        if name.endswith('.pkl') and name != os.path.basename(path):
+            os.remove(os.path.join(work_dir, name))
+
+
+def run_cleaning_pipeline(file_path, cleaned_path=None, only=None, skip=(), work_dir=None, source_id=None):
+    """
+    Run the cleaning stages in order and return the CleaningArtifacts.
+    only       names of the stages to run (e.g. validation_stages); the rest are skipped
+    skip       names of stages to skip
+    work_dir   if given, the artifacts are checkpointed there after every stage, and a
+               rerun on the same input resumes after the last stage that completed.
+               Each run writes to its own attempt_* folder inside it, so concurrent
+               runs on the same input never delete each other's checkpoints
+    source_id  what makes two inputs the same for resuming; defaults to the file's
+               path, size and mtime (the upload cache passes the content hash)
+    """
+    source_id = source_id or _source_id(file_path)
+    artifacts = _resume(source_id, work_dir) if work_dir and os.path.isdir(work_dir) else None
+    if artifacts is None:
+        artifacts = CleaningArtifacts(file_path, source_id)
+    else:
+        print(f"Resuming cleaning of {file_path} after stage '{artifacts.completed[-1]}'")
+        artifacts.file_path = file_path
+        artifacts.timings = []
+    if work_dir:
+        artifacts.attempt_dir = os.path.join(work_dir, f"attempt_{uuid.uuid4().hex[:12]}")
+        os.makedirs(artifacts.attempt_dir)
+
+    for position, stage in enumerate(cleaning_stages):
+        if stage.name in artifacts.completed:
+            artifacts.timings.append((stage.name, 0.0, 'resumed'))
+            continue
+        if stage.name in skip or (only is not None and stage.name not in only) or not stage.applies_to(artifacts):
+            artifacts.timings.append((stage.name, 0.0, 'skipped'))
+            continue
+
+        started = time.perf_counter()
+        stage.run(artifacts, cleaned_path)
+        stage.check_outputs(artifacts)
+        artifacts.timings.append((stage.name, time.perf_counter() - started, 'ran'))
+        artifacts.completed.append(stage.name)
+
+        if work_dir:
+            _save_checkpoint(artifacts, artifacts.attempt_dir, position, stage)
+
+    ran = [f"{name} {seconds:.2f}s" for name, seconds, status in artifacts.timings if status == 'ran']
+    print(f"Cleaning stages for {os.path.basename(file_path)}: {', '.join(ran)}")
+    return artifacts
+
+
+def validate_upload(file_path):
+    """
+    Fast pre-check before the full clean: find the header and check the enrollment
+    counts, without text normalization or writing anything. Raises ValueError if the
+    header cannot be found; otherwise returns a summary of what the clean would reject.
+    """
+    artifacts = run_cleaning_pipeline(file_path, only=validation_stages)
+    return {
+        'layout': artifacts.layout,
+        'header_row': artifacts.header_row_index + 1,
+        'rows': len(artifacts.table),
+        'rejected_rows': len(artifacts.rejected_rows),
+        'coerced_cells': len(artifacts.coerced_cells),
+    }
+
+
+def clean_data(file_path, cleaned_path=None, work_dir=None, source_id=None):
+    artifacts = run_cleaning_pipeline(file_path, cleaned_path, work_dir=work_dir, source_id=source_id)
+    if work_dir:
+        # Only this run's checkpoints; another run on the same input may still be using its own
+        shutil.rmtree(artifacts.attempt_dir, ignore_errors=True)
+        try:
+            os.rmdir(work_dir)
+        except OSError:
+            pass
+    return artifacts.cleaned_path
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Clean an enrollment CSV, or only validate it.")
+    parser.add_argument('file_path')
+    parser.add_argument('--validate', action='store_true', help="run only the validation pre-check")
+    parser.add_argument('--output', help="where to write the cleaned CSV")
+    parser.add_argument('--work-dir', help="checkpoint stages here and resume from them")
+    args = parser.parse_args()
+    if args.validate:
+        print(validate_upload(args.file_path))
+    else:
+        print(clean_data(args.file_path, args.output, args.work_dir))
@@ -1,56 +1,75 @@
 import os
-import pandas as pd
-import re
+import numpy as np
 
 def get_dataset_path(filename="Cleaned_School_DataSet.csv"):
     return os.path.join(os.path.dirname(__file__), 'static', filename)
 
-def fetch_enrollment_records_from_csv(file_path):
-    try:
-        df = pd.read_csv(file_path)
-        return df.to_dict(orient='records')
-    except FileNotFoundError as e:
-        print(f"Error: File not found at {file_path}: {e}")
-        return []
-    except Exception as e:
-        print(f"An error occurred: {e}")
-        return []
-
-def fetch_summary_data_from_csv(file_path):
-    try:
-        df = pd.read_csv(file_path)
+# Columns that describe a school rather than count learners
+non_enrollment_cols = [
+    'Region', 'Division', 'District', 'BEIS School ID', 'School Name',
+    'Street Address', 'Province', 'Municipality', 'Legislative District',
+    'Barangay', 'Sector', 'School Subclassification', 'School Type', 'Modified COC'
+]
 
-        male_cols = [col for col in df.columns if re.search(r'\bmale\b', col, re.IGNORECASE)]
-        female_cols = [col for col in df.columns if re.search(r'\bfemale\b', col, re.IGNORECASE)]
+# Query-string filters accepted by the records API and the column each one matches
+record_filters = {'region': 'Region', 'division': 'Division', 'sector': 'Sector'}
 
-        for col in male_cols + female_cols:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
+def grade_columns(columns, grade):
+    # G11/G12 columns carry the strand in the middle ("G11 ACAD STEM Male");
+    # the other grades are matched by prefix, so "G1" does not pick up "G10"
+    if grade in ['G11', 'G12']:
+        return [col for col in columns if grade in col and ("Male" in col or "Female" in col)]
+    return [col for col in columns if col.startswith(f"{grade} Male") or col.startswith(f"{grade} Female")]
 
-        total_male = df[male_cols].sum().sum()
-        total_female = df[female_cols].sum().sum()
-        total_enrollments = total_male + total_female
+def project_record_columns(all_columns, columns=None, grade=None):
+    """
+    Resolve the columns an API caller asked for. Unknown names raise ValueError;
+    a grade keeps the descriptive columns and only that grade's enrollment columns.
+    """
+    all_columns = list(all_columns)
+    if columns:
+        unknown = [col for col in columns if col not in all_columns]
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+        selected = columns
+    else:
+        selected = all_columns
 
-        is_school_level = 'BEIS School ID' in df.columns
-        number_of_schools = df['BEIS School ID'].nunique() if is_school_level else None
-        number_of_year_levels = 13
+    if grade:
+        keep = set(grade_columns(all_columns, grade))
+        if not keep:
+            raise ValueError(f"Unknown grade: {grade}")
+        selected = [col for col in selected if col in non_enrollment_cols or col in keep]
+    return selected
 
-        # Try to find the 'Region' column regardless of casing
-        region_col = next((col for col in df.columns if col.strip().lower() == 'region'), None)
-        number_of_regions = df[region_col].nunique() if region_col else 0
+def select_record_positions(backend, filters=None, after=None):
+    """
+    Row positions matching the equality filters, in dataset order, starting after
+    the row position held by the cursor.
+    """
+    columns = backend.columns()
+    column_filters = {}
+    for param, value in (filters or {}).items():
+        col = record_filters[param]
+        if col not in columns:
+            raise ValueError(f"Dataset has no {col} column")
+        column_filters[col] = value
 
-        summary = {
-            'totalEnrollments': int(total_enrollments),
-            'maleEnrollments': int(total_male),
-            'femaleEnrollments': int(total_female),
-            'numberOfYearLevels': number_of_year_levels,
-            'regionsWithSchools': int(number_of_regions)
-        }
+    positions = backend.positions(column_filters)
+    if after is not None:
+        positions = positions[np.searchsorted(positions, after, side='right'):]
+    return positions
 
-        if is_school_level:
-            summary['numberOfSchools'] = int(number_of_schools)
+def encode_cursor(version, position):
+    return f"{version}.{position}"
 
-        return summary
-
-    except Exception as e:
-        print(f"Error processing summary data: {e}")
-        return {}
\ No newline at end of file
+def decode_cursor(cursor, version):
+    # Cursors are row positions, so they are only valid for the version that issued them
+    try:
+        cursor_version, position = cursor.rsplit('.', 1)
+        position = int(position)
+    except ValueError:
+        raise ValueError("Malformed cursor")
+    if cursor_version != version:
+        raise ValueError("Cursor belongs to a different dataset version; restart without a cursor")
+    return position
@@ -0,0 +1,276 @@
+import os
+import time
+import sqlite3
+import operator
+import numpy as np
+import pandas as pd
+from dataset_store import load_dataset, load_dataset_version, current_version, get_version_directory
+
+# "pandas" keeps the whole dataset in a (memory-mapped) frame, which is all a small
+# deployment needs. "sqlite" loads each dataset version into a local database file
+# and pushes the report filters and aggregations down as SQL, so multi-year and
+# larger-than-memory datasets stay queryable.
+DATASET_BACKEND = os.environ.get('TANAW_DATASET_BACKEND', 'pandas')
+
+SQLITE_FILENAME = 'dataset.sqlite'
+SQLITE_TABLE = 'enrollment'
+SQLITE_CHUNK_ROWS = 50000
+SQLITE_INDEXED_COLUMNS = ['Region', 'Division', 'Sector', 'BEIS School ID']
+# A build lock older than this is taken to belong to a process that died mid-build
+SQLITE_BUILD_TIMEOUT_SECONDS = 15 * 60
+
+# Comparison operators allowed in row conditions, e.g. ('K Male', '<', 10)
+CONDITION_OPERATORS = {
+    '<': operator.lt, '<=': operator.le, '>': operator.gt,
+    '>=': operator.ge, '=': operator.eq, '!=': operator.ne,
+}
+
+
+class PandasBackend:
+    """
+    Filters and aggregates the shared in-process frame from dataset_store.
+    Filters are {column: value} equality matches, as chosen in the report dropdowns.
+    """
+
+    def prepare(self, version):
+        # The published version is all this backend reads
+        pass
+
+    def _mask(self, df, filters=None, conditions=None):
+        mask = None
+        for col, value in (filters or {}).items():
+            match = df[col] == value
+            mask = match if mask is None else mask & match
+        for col, op, value in (conditions or []):
+            if op not in CONDITION_OPERATORS:
+                raise ValueError(f"Unsupported operator: {op}")
+            match = CONDITION_OPERATORS[op](df[col], value)
+            mask = match if mask is None else mask & match
+        return mask
+
+    def _frame(self, filters=None, conditions=None):
+        df = load_dataset()
+        mask = self._mask(df, filters, conditions)
+        return df if mask is None else df[mask]
+
+    def positions(self, filters=None):
+        # Row positions in dataset order, the same numbering the watchlist bitsets use
+        df = load_dataset()
+        mask = self._mask(df, filters)
+        return np.arange(len(df)) if mask is None else np.flatnonzero(mask.to_numpy())
+
+    def rows_at(self, positions, columns=None):
+        df = load_dataset()
+        if columns is None:
+            return df.iloc[positions]
+        return df.iloc[positions, [df.columns.get_loc(col) for col in columns]]
+
+    def columns(self):
+        return list(load_dataset().columns)
+
+    def count(self, filters=None):
+        return len(self._frame(filters))
+
+    def rows(self, filters=None, columns=None, conditions=None):
+        df = self._frame(filters, conditions)
+        return df if columns is None else df[columns]
+
+    def column_totals(self, filters=None, columns=None):
+        df = self._frame(filters)
+        return df[columns].sum()
+
+    def group_totals(self, group_col, columns, filters=None):
+        return self._frame(filters).groupby(group_col, observed=True)[columns].sum()
+
+    def value_counts(self, column, filters=None):
+        # Tied counts keep the order of first appearance, as in the SQLite backend; a
+        # categorical column's own value_counts would order them by category
+        values = self._frame(filters)[column].dropna()
+        counts = values.value_counts(sort=False).reindex(values.unique())
+        return counts.sort_values(ascending=False, kind='stable')
+
+    def nunique(self, column, filters=None):
+        return self._frame(filters)[column].nunique()
+
+    def distinct(self, column, filters=None):
+        # In order of first appearance, like Series.unique()
+        return list(self._frame(filters)[column].unique())
+
+
+def _quote(col):
+    return '"' + str(col).replace('"', '""') + '"'
+
+
+class SQLiteBackend:
+    """
+    Same interface as PandasBackend, answered by SQL over one database file per
+    dataset version (dataset_store/<version>/dataset.sqlite), indexed on the filter
+    columns. The file lives in the version folder, so it is pruned with it.
+    Until a dataset is uploaded there is no database, and every query answers with
+    the empty result it would give over an empty table.
+    """
+
+    def __init__(self):
+        self._database_version = None
+
+    def _current_database(self):
+        version = current_version()
+        if version is None:
+            return None
+        path = os.path.join(get_version_directory(version), SQLITE_FILENAME)
+        if version != self._database_version:
+            # Normally built at upload; this covers versions published some other way
+            self.prepare(version)
+            self._database_version = version
+        return path
+
+    def prepare(self, version):
+        """
+        Build the database for a published version unless it exists. One process
+        builds it; the others wait for the file instead of each building their own.
+        """
+        path = os.path.join(get_version_directory(version), SQLITE_FILENAME)
+        lock_path = f'{path}.lock'
+        while not os.path.exists(path):
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock_path) > SQLITE_BUILD_TIMEOUT_SECONDS:
+                        os.remove(lock_path)
+                except OSError:
+                    pass
+                time.sleep(0.2)
+                continue
+            try:
+                if not os.path.exists(path):
+                    self._build_database(version, path)
+            finally:
+                os.remove(lock_path)
+        return path
+
+    def _build_database(self, version, database_path):
+        # Copied from the version's mapped blocks a chunk at a time, so neither the
+        # CSV nor the frame has to fit in memory at once
+        df = load_dataset_version(version)
+        temp_path = f'{database_path}.{os.getpid()}.tmp'
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+        con = sqlite3.connect(temp_path)
+        try:
+            for start in range(0, max(len(df), 1), SQLITE_CHUNK_ROWS):
+                df.iloc[start:start + SQLITE_CHUNK_ROWS].to_sql(SQLITE_TABLE, con, if_exists='append', index=False)
+            for col in SQLITE_INDEXED_COLUMNS:
+                if col in df.columns:
+                    index_name = 'idx_' + col.lower().replace(' ', '_')
+                    con.execute(f'CREATE INDEX {_quote(index_name)} ON {SQLITE_TABLE} ({_quote(col)})')
+            con.commit()
+        finally:
+            con.close()
+        os.replace(temp_path, database_path)
+
+    def _query(self, sql, params=(), empty=None):
+        database = self._current_database()
+        if database is None:
+            return pd.DataFrame() if empty is None else empty
+        con = sqlite3.connect(f'file:{database}?mode=ro', uri=True)
+        try:
+            return pd.read_sql_query(sql, con, params=params)
+        finally:
+            con.close()
+
+    def _where(self, filters=None, conditions=None, not_null=None):
+        clauses, params = [], []
+        for col, value in (filters or {}).items():
+            clauses.append(f'{_quote(col)} = ?')
+            params.append(value)
+        for col, op, value in (conditions or []):
+            if op not in CONDITION_OPERATORS:
+                raise ValueError(f"Unsupported operator: {op}")
+            clauses.append(f'{_quote(col)} {op} ?')
+            params.append(value)
+        if not_null is not None:
+            clauses.append(f'{_quote(not_null)} IS NOT NULL')
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+    def columns(self):
+        info = self._query(f'PRAGMA table_info({SQLITE_TABLE})', empty=pd.DataFrame({'name': []}))
+        return list(info['name'])
+
+    def count(self, filters=None):
+        where, params = self._where(filters)
+        return int(self._query(f'SELECT COUNT(*) AS n FROM {SQLITE_TABLE}{where}', params, empty=pd.DataFrame({'n': [0]}))['n'].iloc[0])
+
+    def rows(self, filters=None, columns=None, conditions=None):
+        selected = ', '.join(_quote(col) for col in columns) if columns is not None else '*'
+        where, params = self._where(filters, conditions)
+        return self._query(f'SELECT {selected} FROM {SQLITE_TABLE}{where} ORDER BY rowid', params, empty=pd.DataFrame(columns=columns or []))
+
+    def positions(self, filters=None):
+        # rowid is assigned in CSV order, so rowid - 1 is the row position
+        where, params = self._where(filters)
+        result = self._query(f'SELECT rowid - 1 AS position FROM {SQLITE_TABLE}{where} ORDER BY rowid', params,
+                             empty=pd.DataFrame({'position': np.array([], dtype='int64')}))
+        return result['position'].to_numpy(dtype='int64')
+
+    def rows_at(self, positions, columns=None):
+        selected = ', '.join(_quote(col) for col in columns) if columns is not None else '*'
+        parts = []
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(positions), 900):
+            chunk = [int(position) + 1 for position in positions[start:start + 900]]
+            placeholders = ', '.join('?' * len(chunk))
+            parts.append(self._query(f'SELECT {selected} FROM {SQLITE_TABLE} WHERE rowid IN ({placeholders}) ORDER BY rowid', chunk))
+        if not parts:
+            return self._query(f'SELECT {selected} FROM {SQLITE_TABLE} LIMIT 0', empty=pd.DataFrame(columns=columns or []))
+        return pd.concat(parts, ignore_index=True)
+
+    def column_totals(self, filters=None, columns=None):
+        if not columns:
+            return pd.Series(dtype='int64')
+        sums = ', '.join(f'COALESCE(SUM({_quote(col)}), 0)' for col in columns)
+        where, params = self._where(filters)
+        totals = self._query(f'SELECT {sums} FROM {SQLITE_TABLE}{where}', params, empty=pd.DataFrame([[0] * len(columns)]))
+        return pd.Series(totals.iloc[0].to_numpy(), index=columns)
+
+    def group_totals(self, group_col, columns, filters=None):
+        sums = ''.join(f', COALESCE(SUM({_quote(col)}), 0) AS {_quote(col)}' for col in columns)
+        where, params = self._where(filters, not_null=group_col)
+        totals = self._query(
+            f'SELECT {_quote(group_col)}{sums} FROM {SQLITE_TABLE}{where} '
+            f'GROUP BY {_quote(group_col)} ORDER BY {_quote(group_col)}', params,
+            empty=pd.DataFrame(columns=[group_col] + list(columns)))
+        return totals.set_index(group_col)
+
+    def value_counts(self, column, filters=None):
+        where, params = self._where(filters, not_null=column)
+        counts = self._query(
+            f'SELECT {_quote(column)}, COUNT(*) AS count FROM {SQLITE_TABLE}{where} '
+            f'GROUP BY {_quote(column)} ORDER BY count DESC, MIN(rowid)', params,
+            empty=pd.DataFrame({column: [], 'count': np.array([], dtype='int64')}))
+        return counts.set_index(column)['count']
+
+    def nunique(self, column, filters=None):
+        where, params = self._where(filters)
+        result = self._query(f'SELECT COUNT(DISTINCT {_quote(column)}) AS n FROM {SQLITE_TABLE}{where}', params, empty=pd.DataFrame({'n': [0]}))
+        return int(result['n'].iloc[0])
+
+    def distinct(self, column, filters=None):
+        where, params = self._where(filters)
+        values = self._query(
+            f'SELECT {_quote(column)} FROM {SQLITE_TABLE}{where} '
+            f'GROUP BY {_quote(column)} ORDER BY MIN(rowid)', params, empty=pd.DataFrame({column: []}))
+        return list(values[column])
+
+
+_backends = {'pandas': PandasBackend, 'sqlite': SQLiteBackend}
+_backend = {}
+
+
+def get_backend():
+    if 'instance' not in _backend:
+        if DATASET_BACKEND not in _backends:
+            raise ValueError(f"Unknown dataset backend: {DATASET_BACKEND}")
+        _backend['instance'] = _backends[DATASET_BACKEND]()
+    return _backend['instance']
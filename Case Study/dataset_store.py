@@ -0,0 +1,378 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+from data_config import get_dataset_path
+
+# Attaching a version without copying it builds the frame from pandas internals
+# (BlockManager, make_block, DataFrame._from_mgr), which are not public API. That
+# path is only taken on the pandas releases it was written against: 2.1, which added
+# DataFrame._from_mgr, up to but not including 3.0. Any other pandas goes through
+# the public DataFrame constructor, which copies the dataset into every worker.
+ZERO_COPY_PANDAS = ((2, 1), (3, 0))
+try:
+    from pandas.core.internals import BlockManager
+    from pandas.core.internals.api import make_block
+    _zero_copy = ZERO_COPY_PANDAS[0] <= tuple(int(part) for part in pd.__version__.split('.')[:2]) < ZERO_COPY_PANDAS[1]
+except (ImportError, ValueError):
+    _zero_copy = False
+if not _zero_copy:
+    print(f"Warning: pandas {pd.__version__} is outside the range the shared dataset supports "
+          f"({'.'.join(map(str, ZERO_COPY_PANDAS[0]))} to <{'.'.join(map(str, ZERO_COPY_PANDAS[1]))}); "
+          f"every worker will hold its own copy of the dataset.")
+
+# Published dataset versions live here, one folder per version, plus a CURRENT
+# pointer naming the active one. Every worker process memory-maps the same files,
+# so the dataset is held once per node instead of once per worker.
+STORE_DIRECTORY = os.path.join(os.path.dirname(__file__), 'dataset_store')
+CURRENT_POINTER = os.path.join(STORE_DIRECTORY, 'CURRENT')
+VERSIONS_TO_KEEP = 2
+# Bumped when the on-disk layout changes, so older versions are republished
+STORE_FORMAT = 2
+# The CSV is read in chunks of this many rows, so publishing never holds the whole file
+PUBLISH_CHUNK_ROWS = 50000
+
+# Per-process state: the last checked pointer/CSV stamps and the version they name,
+# and the version currently attached with its memory-mapped frame
+_checked = {'version': None, 'pointer_mtime': None, 'source_stamp': None}
+_attached = {'version': None, 'df': pd.DataFrame()}
+
+
+def _source_stamp(csv_path):
+    stat = os.stat(csv_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _file_version(csv_path):
+    digest = hashlib.sha1(f'format {STORE_FORMAT}\n'.encode())
+    with open(csv_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def _chunk_kind(values):
+    if pd.api.types.is_bool_dtype(values):
+        return 'bools'
+    if pd.api.types.is_integer_dtype(values):
+        return 'ints'
+    if pd.api.types.is_float_dtype(values):
+        return 'floats'
+    return 'text'
+
+
+def _column_kinds(csv_path):
+    # First pass: the dtype each column would get if the whole file were parsed at
+    # once. A column that is integer in one chunk and float in another is float; any
+    # other disagreement (including bools next to numbers) makes it text.
+    kinds, rows = {}, 0
+    for chunk in pd.read_csv(csv_path, chunksize=PUBLISH_CHUNK_ROWS):
+        rows += len(chunk)
+        for col in chunk.columns:
+            kind = _chunk_kind(chunk[col])
+            seen = kinds.setdefault(col, kind)
+            if seen != kind:
+                kinds[col] = 'floats' if {seen, kind} <= {'ints', 'floats'} else 'text'
+    return kinds, rows
+
+
+def _open_block(path, dtype, columns, rows):
+    # One row per dataset column: the same (columns x rows) shape pandas keeps its
+    # blocks in, so the mapped array becomes a block as is.
+    return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(columns, rows))
+
+
+def _write_blocks(csv_path, temp_dir):
+    """
+    Write the CSV into temp_dir as column blocks, a chunk at a time, and return the
+    meta.json contents (without the version). Numbers are written on the second
+    pass, which also collects each text column's distinct values; a third pass over
+    the text columns only writes their codes.
+    """
+    kinds, rows = _column_kinds(csv_path)
+    text_cols = [col for col, kind in kinds.items() if kind == 'text']
+
+    # placement: column -> (block, row in that block)
+    placement, block_sizes = {}, {}
+    def place(col, block):
+        placement[col] = (block, block_sizes.get(block, 0))
+        block_sizes[block] = block_sizes.get(block, 0) + 1
+
+    for col, kind in kinds.items():
+        if kind != 'text':
+            place(col, 'ints' if kind == 'bools' else kind)
+    numbers = {
+        block: _open_block(os.path.join(temp_dir, f'{block}.npy'), 'int64' if block == 'ints' else 'float64', size, rows)
+        for block, size in block_sizes.items()
+    }
+
+    uniques = {col: set() for col in text_cols}
+    start = 0
+    # Text columns are read as the strings in the file, as they are when the whole file is parsed
+    for chunk in pd.read_csv(csv_path, chunksize=PUBLISH_CHUNK_ROWS, dtype={col: str for col in text_cols}):
+        stop = start + len(chunk)
+        for col in chunk.columns:
+            if col in uniques:
+                uniques[col].update(chunk[col].dropna())
+            else:
+                block, row = placement[col]
+                numbers[block][row, start:stop] = chunk[col].to_numpy(dtype=numbers[block].dtype)
+        start = stop
+    for values in numbers.values():
+        values.flush()
+    del numbers
+
+    # Codes are stored in the integer width pandas uses for that many categories
+    categories = {}
+    for col in text_cols:
+        categories[col] = sorted(uniques.pop(col))
+        place(col, f'codes_{pd.Categorical([], categories=categories[col]).codes.dtype}')
+
+    if text_cols:
+        codes = {
+            block: _open_block(os.path.join(temp_dir, f'{block}.npy'), block[len('codes_'):], block_sizes[block], rows)
+            for block in {placement[col][0] for col in text_cols}
+        }
+        lookups = {col: pd.Index(categories[col], dtype=object) for col in text_cols}
+        start = 0
+        for chunk in pd.read_csv(csv_path, chunksize=PUBLISH_CHUNK_ROWS, usecols=text_cols, dtype=str):
+            stop = start + len(chunk)
+            for col in text_cols:
+                block, row = placement[col]
+                codes[block][row, start:stop] = lookups[col].get_indexer(chunk[col])
+            start = stop
+        for values in codes.values():
+            values.flush()
+        del codes
+
+    # layout: [block, column] in dataset order; block is 'ints', 'floats' or 'codes_<int width>'
+    layout = [[placement[col][0], col] for col in kinds]
+    return {'format': STORE_FORMAT, 'rows': rows, 'layout': layout, 'categories': categories}
+
+
+def publish_dataset(csv_path=None, activate=True):
+    """
+    Write the CSV as memory-mappable column blocks, reading it in chunks so the file
+    never has to fit in memory. Integer and float columns become 2-D .npy blocks;
+    text columns (Region, Division, Sector, School Name, ...) become category codes,
+    which also serve as the lookup index for the report filters. Codes are stored in
+    the integer width pandas uses for that many categories, grouped into one block
+    per width, so they are mapped without conversion. Returns the published version id.
+    With activate=False the version is written but not made current; the caller
+    finishes preparing it and then calls activate_version.
+    """
+    csv_path = csv_path or get_dataset_path()
+    version = _file_version(csv_path)
+    version_dir = os.path.join(STORE_DIRECTORY, version)
+
+    if not os.path.exists(version_dir):
+        os.makedirs(STORE_DIRECTORY, exist_ok=True)
+        temp_dir = os.path.join(STORE_DIRECTORY, f'tmp_{version}_{os.getpid()}')
+        os.makedirs(temp_dir, exist_ok=True)
+        meta = _write_blocks(csv_path, temp_dir)
+        with open(os.path.join(temp_dir, 'meta.json'), 'w') as f:
+            json.dump({'version': version, **meta}, f)
+
+        try:
+            os.replace(temp_dir, version_dir)
+        except OSError:
+            # Another worker published the same version first
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    if activate:
+        activate_version(version, csv_path)
+    return version
+
+
+def activate_version(version, csv_path=None):
+    """Make a published version the active one for every worker, then prune old versions."""
+    _set_current(version, csv_path or get_dataset_path())
+    _prune_versions(version)
+
+
+def _set_current(version, csv_path):
+    # Remember the version being replaced so rules can compare against it
+    previous = get_previous_version(version)
+    temp_pointer = f'{CURRENT_POINTER}.{os.getpid()}'
+    with open(temp_pointer, 'w') as f:
+        json.dump({'version': version, 'previous': previous, 'format': STORE_FORMAT,
+                   'source': csv_path, 'source_stamp': _source_stamp(csv_path)}, f)
+    os.replace(temp_pointer, CURRENT_POINTER)
+
+
+def _prune_versions(current_version):
+    versions = [
+        name for name in os.listdir(STORE_DIRECTORY)
+        if os.path.isdir(os.path.join(STORE_DIRECTORY, name)) and not name.startswith('tmp_')
+    ]
+    versions.sort(key=lambda name: os.path.getmtime(os.path.join(STORE_DIRECTORY, name)), reverse=True)
+    previous_version = (_read_pointer() or {}).get('previous')
+    stale = [name for name in versions if name not in (current_version, previous_version)][max(VERSIONS_TO_KEEP - 2, 0):]
+    for name in stale:
+        # Still-mapped files cannot be removed on Windows; they are retried on the next publish
+        shutil.rmtree(os.path.join(STORE_DIRECTORY, name), ignore_errors=True)
+    # Databases used to sit next to the version folders as <hash>.sqlite; they now live inside them
+    for name in os.listdir(STORE_DIRECTORY):
+        if name.endswith('.sqlite'):
+            try:
+                os.remove(os.path.join(STORE_DIRECTORY, name))
+            except OSError:
+                pass
+
+
+def _read_pointer():
+    try:
+        with open(CURRENT_POINTER) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _block_positions(meta):
+    positions = {}
+    for position, (block, col) in enumerate(meta['layout']):
+        positions.setdefault(block, []).append(position)
+    return positions
+
+
+def _attach_mapped(version_dir, meta):
+    # The frame is assembled from the mapped arrays themselves. pd.concat or the
+    # DataFrame constructor would copy them into private memory in every worker.
+    blocks = []
+    for block, placement in _block_positions(meta).items():
+        values = np.load(os.path.join(version_dir, f'{block}.npy'), mmap_mode='r')
+        if block.startswith('codes_'):
+            for row, position in enumerate(placement):
+                col = meta['layout'][position][1]
+                column = pd.Categorical.from_codes(values[row], categories=meta['categories'][col], validate=False)
+                blocks.append(make_block(column, placement=[position], ndim=2))
+        else:
+            blocks.append(make_block(values, placement=placement))
+
+    columns = pd.Index([col for _, col in meta['layout']])
+    manager = BlockManager(tuple(blocks), [columns, pd.RangeIndex(meta['rows'])])
+    return pd.DataFrame._from_mgr(manager, axes=manager.axes)
+
+
+def _attach_copied(version_dir, meta):
+    # Public-API fallback: the DataFrame constructor copies the mapped columns into
+    # this process's private memory, so the dataset is held once per worker again.
+    columns = [None] * len(meta['layout'])
+    for block, placement in _block_positions(meta).items():
+        values = np.load(os.path.join(version_dir, f'{block}.npy'), mmap_mode='r')
+        for row, position in enumerate(placement):
+            col = meta['layout'][position][1]
+            if block.startswith('codes_'):
+                columns[position] = pd.Categorical.from_codes(values[row], categories=meta['categories'][col], validate=False)
+            else:
+                columns[position] = values[row]
+    return pd.DataFrame({col: column for (_, col), column in zip(meta['layout'], columns)})
+
+
+def _attach(version):
+    version_dir = os.path.join(STORE_DIRECTORY, version)
+    with open(os.path.join(version_dir, 'meta.json')) as f:
+        meta = json.load(f)
+
+    if not meta['layout']:
+        return pd.DataFrame()
+    if _zero_copy:
+        try:
+            return _attach_mapped(version_dir, meta)
+        except Exception as e:
+            print(f"Warning: could not attach dataset version {version} without copying ({e}); "
+                  f"this worker will hold its own copy of the dataset.")
+    return _attach_copied(version_dir, meta)
+
+
+def get_active_version():
+    pointer = _read_pointer()
+    return pointer['version'] if pointer else None
+
+
+def get_previous_version(version=None):
+    # The version that `version` (default: the active one) replaced, or will replace
+    # once activated
+    pointer = _read_pointer() or {}
+    if version is None or version == pointer.get('version'):
+        return pointer.get('previous')
+    return pointer.get('version')
+
+
+def get_version_directory(version):
+    return os.path.join(STORE_DIRECTORY, version)
+
+
+def get_version_columns(version):
+    with open(os.path.join(STORE_DIRECTORY, version, 'meta.json')) as f:
+        return [col for _, col in json.load(f)['layout']]
+
+
+def load_dataset_version(version):
+    # Older versions are attached on demand and not cached
+    if version == _attached['version']:
+        return _attached['df']
+    if not version or not os.path.exists(os.path.join(STORE_DIRECTORY, version)):
+        return None
+    with open(os.path.join(STORE_DIRECTORY, version, 'meta.json')) as f:
+        if json.load(f).get('format') != STORE_FORMAT:
+            # Written by an older store layout; treated as gone
+            return None
+    return _attach(version)
+
+
+def current_version():
+    """
+    Return the active version id without attaching its frame, or None if there is no
+    dataset. The pointer file is only re-read when its mtime changes, so the check
+    costs two stat calls per request. If the CSV on disk no longer matches the
+    published version (or nothing is published yet) it is published here.
+    """
+    csv_path = get_dataset_path()
+    try:
+        source_stamp = _source_stamp(csv_path)
+    except FileNotFoundError:
+        print(f"Error: File not found at {csv_path}")
+        return None
+
+    try:
+        pointer_mtime = os.stat(CURRENT_POINTER).st_mtime_ns
+    except FileNotFoundError:
+        pointer_mtime = None
+
+    if pointer_mtime is not None and pointer_mtime == _checked['pointer_mtime'] \
+            and source_stamp == _checked['source_stamp']:
+        return _checked['version']
+
+    pointer = _read_pointer()
+    if pointer is None or pointer.get('source_stamp') != source_stamp \
+            or pointer.get('format') != STORE_FORMAT \
+            or not os.path.exists(os.path.join(STORE_DIRECTORY, pointer['version'])):
+        publish_dataset(csv_path)
+        pointer = _read_pointer()
+
+    _checked['version'] = pointer['version']
+    _checked['pointer_mtime'] = os.stat(CURRENT_POINTER).st_mtime_ns
+    _checked['source_stamp'] = source_stamp
+    return pointer['version']
+
+
+def load_dataset():
+    """
+    Return the active dataset as a read-only, memory-mapped DataFrame, attaching the
+    version current_version() names when it changes.
+    """
+    try:
+        version = current_version()
+        if version is None:
+            return pd.DataFrame()
+        if version != _attached['version']:
+            _attached['df'] = _attach(version)
+            _attached['version'] = version
+    except Exception as e:
+        print(f"An error occurred while loading the shared dataset: {e}")
+        return pd.read_csv(get_dataset_path())
+
+    return _attached['df']
@@ -0,0 +1,330 @@
+"""
+Concurrent-user load test for the TANAW Dash pages.
+
+Each simulated user replays what a person does in the browser: load /dashreport/,
+let the initial update_dashboard fire, pick a region, division, grade and school,
+download the filtered CSV, reset, then do the same on /dashenrollment/. Requests
+are the same _dash-update-component POSTs the browser sends.
+
+    python loadtest.py --base-url http://127.0.0.1:5000 --users 50 --duration 120 --server-pid 1234
+
+Reports throughput, p50/p95/p99 latency per step and the server's memory over time
+(the given pid plus its child worker processes), as PSS: pages shared between
+workers, like the memory-mapped dataset, are split between them instead of being
+counted once per worker.
+"""
+import os
+import csv
+import json
+import time
+import random
+import argparse
+import threading
+import urllib.request
+import urllib.error
+from collections import defaultdict
+
+REPORT_PREFIX = '/dashreport/'
+WORKS_PREFIX = '/dashenrollment/'
+REPORT_GRADES = ['K'] + [f'G{i}' for i in range(1, 13)]
+
+REPORT_OUTPUTS = [
+    ('kpi-cards', 'children'), ('region-enrollment-bar', 'figure'), ('grade-gender-parity-bar', 'figure'),
+    ('sector-distribution', 'figure'), ('education-stage-distribution', 'figure'), ('flagged-schools-table', 'children'),
+]
+REPORT_FILTERS = ['region-filter', 'division-filter', 'grade-filter', 'sector-filter', 'beis-id-filter']
+WORKS_SCHOOL_OUTPUTS = [
+    ('school-table', 'data'), ('enrollment-bar-chart', 'figure'), ('school-details', 'children'),
+    ('gender-pie-chart', 'figure'), ('enrollment-line-chart', 'figure'),
+]
+
+
+def _output_spec(outputs):
+    if len(outputs) == 1:
+        component_id, prop = outputs[0]
+        return f'{component_id}.{prop}', {'id': component_id, 'property': prop}
+    spec = '..' + '...'.join(f'{component_id}.{prop}' for component_id, prop in outputs) + '..'
+    return spec, [{'id': component_id, 'property': prop} for component_id, prop in outputs]
+
+
+def dash_callback_body(outputs, inputs, state=None, changed=None):
+    output, outputs_field = _output_spec(outputs)
+    body = {
+        'output': output,
+        'outputs': outputs_field,
+        'inputs': [{'id': component_id, 'property': prop, 'value': value} for component_id, prop, value in inputs],
+        'changedPropIds': [f'{component_id}.{prop}' for component_id, prop in (changed or [])],
+    }
+    if state:
+        body['state'] = [{'id': component_id, 'property': prop, 'value': value} for component_id, prop, value in state]
+    return body
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.bytes_received = 0
+
+    def record(self, step, seconds, ok, size):
+        with self.lock:
+            self.latencies[step].append(seconds)
+            self.bytes_received += size
+            if not ok:
+                self.errors[step] += 1
+
+
+class SimulatedUser:
+    def __init__(self, base_url, stats, catalog, think_time, rng):
+        self.base_url = base_url.rstrip('/')
+        self.stats = stats
+        self.catalog = catalog
+        self.think_time = think_time
+        self.rng = rng
+
+    def _request(self, step, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, headers={
+            'Content-Type': 'application/json', 'Accept-Encoding': 'gzip',
+        })
+        started = time.perf_counter()
+        ok, size = True, 0
+        try:
+            with urllib.request.urlopen(request, timeout=120) as response:
+                size = len(response.read())
+        except (urllib.error.URLError, OSError):
+            ok = False
+        self.stats.record(step, time.perf_counter() - started, ok, size)
+
+    def _pause(self):
+        if self.think_time:
+            time.sleep(self.rng.uniform(0, self.think_time))
+
+    def _report_update(self, step, filters):
+        inputs = [(component_id, 'value', filters.get(component_id)) for component_id in REPORT_FILTERS]
+        self._request(step, REPORT_PREFIX + '_dash-update-component', dash_callback_body(REPORT_OUTPUTS, inputs))
+
+    def report_session(self):
+        self._request('report page', REPORT_PREFIX)
+        self._request('report layout', REPORT_PREFIX + '_dash-layout')
+        self._request('report dependencies', REPORT_PREFIX + '_dash-dependencies')
+        filters = {}
+        self._report_update('report initial', filters)
+        self._pause()
+
+        school = self.rng.choice(self.catalog)
+        filters['region-filter'] = school['Region']
+        self._report_update('report region', filters)
+        self._pause()
+
+        if school.get('Division') is not None:
+            filters['division-filter'] = school['Division']
+            self._report_update('report division', filters)
+            self._pause()
+
+        filters['grade-filter'] = self.rng.choice(REPORT_GRADES)
+        self._report_update('report grade', filters)
+        self._pause()
+
+        if school.get('BEIS School ID') is not None:
+            filters['beis-id-filter'] = school['BEIS School ID']
+            self._report_update('report school', filters)
+            self._pause()
+
+        state = [(component_id, 'value', filters.get(component_id)) for component_id in REPORT_FILTERS]
+        self._request('report download', REPORT_PREFIX + '_dash-update-component', dash_callback_body(
+            [('download-data', 'data')], [('btn-download', 'n_clicks', 1)], state, [('btn-download', 'n_clicks')]))
+        self._pause()
+
+        # The reset itself runs in the browser; the server only sees the refresh
+        self._report_update('report reset', {})
+
+    def works_session(self):
+        self._request('works page', WORKS_PREFIX)
+        self._request('works layout', WORKS_PREFIX + '_dash-layout')
+        self._request('works regions', WORKS_PREFIX + '_dash-update-component', dash_callback_body(
+            [('region-dropdown', 'options')], [('region-dropdown', 'id', 'region-dropdown')]))
+        for output in (('school-dropdown', 'options'), ('summary-stats', 'children')):
+            self._request('works summary', WORKS_PREFIX + '_dash-update-component', dash_callback_body(
+                [output], [('region-dropdown', 'value', None)]))
+        self._pause()
+
+        school = self.rng.choice(self.catalog)
+        for output in (('school-dropdown', 'options'), ('summary-stats', 'children')):
+            self._request('works region', WORKS_PREFIX + '_dash-update-component', dash_callback_body(
+                [output], [('region-dropdown', 'value', school['Region'])], changed=[('region-dropdown', 'value')]))
+        self._pause()
+
+        if school.get('School Name') is not None:
+            self._request('works school', WORKS_PREFIX + '_dash-update-component', dash_callback_body(
+                WORKS_SCHOOL_OUTPUTS, [('school-dropdown', 'value', school['School Name'])], changed=[('school-dropdown', 'value')]))
+        self._pause()
+
+    def run(self, deadline):
+        while time.time() < deadline:
+            self.report_session()
+            if time.time() < deadline:
+                self.works_session()
+
+
+def fetch_catalog(base_url):
+    # Real filter values to replay, taken from the records API
+    url = base_url.rstrip('/') + '/api/enrollment_records?format=ndjson&columns=Region,Division,BEIS School ID,School Name'
+    url = url.replace(' ', '%20')
+    with urllib.request.urlopen(url, timeout=120) as response:
+        catalog = [json.loads(line) for line in response.read().decode().splitlines() if line.strip()]
+    return [row for row in catalog if row.get('Region') is not None]
+
+
+def _children(pid):
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            if int(fields[1]) == pid:
+                children.append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+    return children
+
+
+def _process_pss(pid):
+    # Proportional set size from /proc/<pid>/smaps_rollup (Linux 4.14+)
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            if line.startswith('Pss:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def process_tree_pss(pid):
+    """
+    Proportional memory in bytes of pid and all its descendants (psutil if installed,
+    else Linux /proc). Processes that exit while being read are skipped.
+    """
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+
+    if psutil is not None:
+        try:
+            processes = [psutil.Process(pid)]
+            processes += processes[0].children(recursive=True)
+        except psutil.NoSuchProcess:
+            return 0
+        total = 0
+        for process in processes:
+            try:
+                total += process.memory_full_info().pss
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        return total
+
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            total += _process_pss(current)
+        except OSError:
+            continue
+        pending.extend(_children(current))
+    return total
+
+
+def sample_memory(pid, interval, samples, stop):
+    started = time.time()
+    while not stop.is_set():
+        try:
+            samples.append((round(time.time() - started, 1), process_tree_pss(pid)))
+        except Exception as e:
+            # Keep sampling; a failed reading must not end the memory series silently
+            print(f"Memory sample failed: {e}")
+        stop.wait(interval)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def print_report(stats, elapsed, users, memory_samples):
+    all_latencies = sorted(value for values in stats.latencies.values() for value in values)
+    total_requests = len(all_latencies)
+    total_errors = sum(stats.errors.values())
+
+    print(f"\n{users} users, {elapsed:.1f}s, {total_requests} requests, {total_errors} errors")
+    print(f"Throughput: {total_requests / elapsed:.1f} req/s, {stats.bytes_received / elapsed / 1024:.0f} KB/s received")
+    print(f"\n{'step':<22}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for step, values in list(stats.latencies.items()) + [('ALL', all_latencies)]:
+        values = sorted(values)
+        errors = total_errors if step == 'ALL' else stats.errors[step]
+        print(f"{step:<22}{len(values):>8}{errors:>8}"
+              f"{percentile(values, 50) * 1000:>10.0f}{percentile(values, 95) * 1000:>10.0f}"
+              f"{percentile(values, 99) * 1000:>10.0f}{(values[-1] if values else 0) * 1000:>10.0f}")
+
+    if memory_samples:
+        pss = [value for _, value in memory_samples]
+        print(f"\nServer PSS: start {pss[0] / 2**20:.0f} MB, peak {max(pss) / 2**20:.0f} MB, end {pss[-1] / 2**20:.0f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay Dash callback sequences with N concurrent users.")
+    parser.add_argument('--base-url', default='http://127.0.0.1:5000')
+    parser.add_argument('--users', type=int, default=20, help="concurrent simulated users")
+    parser.add_argument('--duration', type=float, default=60, help="seconds to keep users running")
+    parser.add_argument('--ramp-up', type=float, default=5, help="seconds over which users start")
+    parser.add_argument('--think-time', type=float, default=1.0, help="max random pause between steps, seconds")
+    parser.add_argument('--server-pid', type=int, help="server (or master) pid to sample memory from")
+    parser.add_argument('--memory-interval', type=float, default=1.0)
+    parser.add_argument('--memory-csv', help="write the memory samples to this CSV")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    catalog = fetch_catalog(args.base_url)
+    if not catalog:
+        raise SystemExit("The records API returned no rows; upload a dataset first.")
+
+    stats = Stats()
+    memory_samples, stop = [], threading.Event()
+    sampler = None
+    if args.server_pid:
+        if not process_tree_pss(args.server_pid):
+            raise SystemExit(f"Cannot read the memory of pid {args.server_pid}.")
+        sampler = threading.Thread(target=sample_memory, args=(args.server_pid, args.memory_interval, memory_samples, stop), daemon=True)
+        sampler.start()
+
+    started = time.time()
+    deadline = started + args.duration
+    threads = []
+    for i in range(args.users):
+        user = SimulatedUser(args.base_url, stats, catalog, args.think_time, random.Random(args.seed + i))
+        thread = threading.Thread(target=user.run, args=(deadline,), daemon=True)
+        thread.start()
+        threads.append(thread)
+        if args.ramp_up:
+            time.sleep(args.ramp_up / args.users)
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - started
+
+    stop.set()
+    if sampler:
+        sampler.join()
+    if args.memory_csv and memory_samples:
+        with open(args.memory_csv, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['seconds', 'pss_bytes'])
+            writer.writerows(memory_samples)
+
+    print_report(stats, elapsed, args.users, memory_samples)
+
+
+if __name__ == "__main__":
+    main()
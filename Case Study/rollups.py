@@ -0,0 +1,183 @@
+import os
+import re
+import pandas as pd
+from data_config import non_enrollment_cols
+from dataset_store import current_version, load_dataset_version, get_active_version, get_version_columns, get_version_directory
+
+# Totals at national, region and division level, computed once per dataset version
+# and saved next to it. Summary views look up one row here instead of filtering and
+# summing the whole dataset on every dropdown change.
+ROLLUP_LEVELS = {'national': [], 'region': ['Region'], 'division': ['Region', 'Division']}
+ROLLUPS_FILENAME = 'rollups_v1.pkl'
+
+_cache = {'version': None, 'rollups': None, 'columns': []}
+
+
+def _grade_of(col):
+    # "G11 ACAD STEM Male" -> "G11", "Elem NG Female" -> "Elem NG"
+    grade = re.sub(r'\s+(Male|Female)$', '', col)
+    return grade.split(' ')[0] if re.match(r'^(K|G\d{1,2})\b', grade) else grade
+
+
+def _level_tables(df, keys, count_cols, enrollment_cols):
+    if keys:
+        groups = df.groupby(keys, observed=True)
+        columns = groups[count_cols].sum()
+        rows = groups.size()
+        schools = groups['BEIS School ID'].nunique() if 'BEIS School ID' in df.columns else 0
+        school_names = groups['School Name'].nunique() if 'School Name' in df.columns else 0
+    else:
+        columns = df[count_cols].sum().to_frame('All').T
+        rows = pd.Series([len(df)], index=columns.index)
+        schools = df['BEIS School ID'].nunique() if 'BEIS School ID' in df.columns else 0
+        school_names = df['School Name'].nunique() if 'School Name' in df.columns else 0
+
+    male = [col for col in enrollment_cols if col.endswith(' Male')]
+    female = [col for col in enrollment_cols if col.endswith(' Female')]
+    stats = pd.DataFrame({
+        'rows': rows,
+        'schools': schools,
+        'school_names': school_names,
+        'total': columns[enrollment_cols].sum(axis=1),
+        'male': columns[male].sum(axis=1),
+        'female': columns[female].sum(axis=1),
+    }, index=columns.index)
+    stats['average'] = stats['total'] / stats['rows']
+
+    grades = columns[enrollment_cols].T.groupby([_grade_of(col) for col in enrollment_cols], sort=False).sum().T
+    return {'stats': stats, 'grades': grades, 'columns': columns}
+
+
+def compute_rollups(df):
+    """
+    Return {level: {'stats', 'grades', 'columns'}} for every level in ROLLUP_LEVELS.
+    stats    rows, schools (distinct BEIS School IDs), school_names, total, male,
+             female and average enrollment per school row
+    grades   enrollment per grade (K, G1 ... G12, Elem NG, JHS NG)
+    columns  the sum of every numeric count column, for views that pick their own columns
+    """
+    count_cols = [col for col in df.columns if col not in non_enrollment_cols and pd.api.types.is_numeric_dtype(df[col])]
+    enrollment_cols = [col for col in count_cols if col.endswith((' Male', ' Female'))]
+    return {
+        level: _level_tables(df, [key for key in keys if key in df.columns], count_cols, enrollment_cols)
+        for level, keys in ROLLUP_LEVELS.items()
+        if all(key in df.columns for key in keys)
+    }
+
+
+def build_rollups(version=None):
+    """
+    Compute and save the rollups for a dataset version as
+    dataset_store/<version>/rollups_v1.pkl. Run at ingest; the first lookup builds
+    them if they are missing.
+    """
+    version = version or get_active_version()
+    path = os.path.join(get_version_directory(version), ROLLUPS_FILENAME)
+    if os.path.exists(path):
+        return path
+
+    rollups = compute_rollups(load_dataset_version(version))
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    pd.to_pickle(rollups, temp_path)
+    os.replace(temp_path, path)
+    return path
+
+
+def _load_rollups():
+    version = current_version()
+    if version is None:
+        return None
+    if version != _cache['version']:
+        _cache['rollups'] = pd.read_pickle(build_rollups(version))
+        _cache['columns'] = get_version_columns(version)
+        _cache['version'] = version
+    if not _cache['rollups']['national']['stats'].at['All', 'rows']:
+        return None
+    return _cache['rollups']
+
+
+def _level_key(rollups, filters):
+    # The (level, index key) holding exactly the rows the filters select, if there is one
+    filters = filters or {}
+    if not filters:
+        return 'national', 'All'
+    if set(filters) == {'Region'} and 'region' in rollups:
+        return 'region', filters['Region']
+    if set(filters) <= {'Region', 'Division'} and 'Division' in filters and 'division' in rollups:
+        index = rollups['division']['stats'].index
+        matches = index[index.get_level_values('Division') == filters['Division']]
+        if 'Region' in filters:
+            matches = matches[matches.get_level_values('Region') == filters['Region']]
+        if len(matches) == 1:
+            return 'division', matches[0]
+    return None, None
+
+
+def _lookup(filters):
+    rollups = _load_rollups()
+    if rollups is None:
+        return None, None, None
+    level, key = _level_key(rollups, filters)
+    if level is None or key not in rollups[level]['stats'].index:
+        return rollups, None, None
+    return rollups, level, key
+
+
+def get_rollup(filters=None):
+    """
+    Look up the rollup for equality filters on Region and/or Division.
+    Returns {'stats': dict, 'grades': Series}, or None when the filters are not a
+    rollup level (e.g. they include Sector) or select no rows; callers then compute
+    the figures from the backend as before.
+    """
+    rollups, level, key = _lookup(filters)
+    if level is None:
+        return None
+    stats = rollups[level]['stats']
+    return {'stats': {col: stats.at[key, col] for col in stats.columns}, 'grades': rollups[level]['grades'].loc[key]}
+
+
+def get_column_totals(filters, columns):
+    """Shaped like backend.column_totals(filters, columns); None if not a rollup level."""
+    rollups, level, key = _lookup(filters)
+    if level is None or any(col not in rollups[level]['columns'].columns for col in columns):
+        return None
+    return rollups[level]['columns'].loc[key, columns].rename(None)
+
+
+def get_region_totals(filters, columns):
+    """
+    Column totals per region for the rows the filters select, shaped like
+    backend.group_totals('Region', columns, filters). None if not a rollup level.
+    """
+    rollups, level, key = _lookup(filters)
+    if level is None or 'region' not in rollups or any(col not in rollups['region']['columns'].columns for col in columns):
+        return None
+    if level == 'national':
+        return rollups['region']['columns'][columns]
+    region = key if level == 'region' else key[0]
+    return rollups[level]['columns'].loc[[key], columns].set_axis(pd.Index([region], name='Region'))
+
+
+def summary_data():
+    """The /api/enrollment_data summary, read from the national rollup."""
+    rollups = _load_rollups()
+    if rollups is None:
+        return {}
+    national = rollups['national']
+    columns = national['columns'].loc['All']
+    male_cols = [col for col in columns.index if re.search(r'\bmale\b', col, re.IGNORECASE)]
+    female_cols = [col for col in columns.index if re.search(r'\bfemale\b', col, re.IGNORECASE)]
+    total_male = columns[male_cols].sum()
+    total_female = columns[female_cols].sum()
+
+    summary = {
+        'totalEnrollments': int(total_male + total_female),
+        'maleEnrollments': int(total_male),
+        'femaleEnrollments': int(total_female),
+        'numberOfYearLevels': 13,
+        'regionsWithSchools': len(rollups['region']['stats']) if 'region' in rollups else 0,
+    }
+    if 'BEIS School ID' in _cache['columns']:
+        summary['numberOfSchools'] = int(national['stats'].loc['All', 'schools'])
+    return summary
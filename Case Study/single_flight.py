@@ -0,0 +1,68 @@
+import json
+import threading
+import functools
+from dataset_store import current_version
+
+# Identical callback computations that overlap in time share one result. When many
+# users open the report at once they all fire update_dashboard with every filter
+# None; the first request computes it and the rest wait for that result instead of
+# each running the same national aggregation. Nothing is kept once the call ends,
+# so this is coalescing, not caching. It is per process: each worker coalesces
+# its own requests.
+
+_lock = threading.Lock()
+_in_flight = {}
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def _call_key(name, args, kwargs):
+    try:
+        arguments = json.dumps([args, kwargs], sort_keys=True, default=str)
+    except TypeError:
+        return None
+    return name, arguments, current_version()
+
+
+def single_flight(name):
+    """
+    Decorate a Dash callback so concurrent calls with the same inputs on the same
+    dataset version run it once. Waiters get the same return value, or the same
+    exception (including PreventUpdate).
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = _call_key(name, args, kwargs)
+            if key is None:
+                return func(*args, **kwargs)
+
+            with _lock:
+                call = _in_flight.get(key)
+                leader = call is None
+                if leader:
+                    call = _in_flight[key] = _Call()
+
+            if not leader:
+                call.done.wait()
+                if call.error is not None:
+                    raise call.error
+                return call.result
+
+            try:
+                call.result = func(*args, **kwargs)
+                return call.result
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with _lock:
+                    del _in_flight[key]
+                call.done.set()
+        return wrapper
+    return decorator
@@ -0,0 +1,293 @@
+import os
+import io
+import json
+import gzip
+import zlib
+import hashlib
+from flask import request, url_for
+from markupsafe import Markup, escape
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_FOLDER = os.path.join(os.path.dirname(__file__), 'static')
+VARIANTS_FOLDER = os.path.join(STATIC_FOLDER, 'variants')
+VARIANTS_MANIFEST = os.path.join(VARIANTS_FOLDER, 'manifest.json')
+
+# Widths generated for srcset; an image is never upscaled past its own width
+VARIANT_WIDTHS = [320, 640, 1280]
+VARIANT_FORMATS = [('avif', 'image/avif', 50), ('webp', 'image/webp', 75)]
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg'}
+
+# HTML pages, Dash layouts/callback JSON, Dash JS bundles and CSS, and the
+# streamed NDJSON records API
+COMPRESSIBLE_MIMETYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'application/json',
+    'application/javascript', 'text/javascript', 'image/svg+xml',
+    'application/x-ndjson',
+}
+MIN_COMPRESS_SIZE = 500
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+# Files larger than this (e.g. /clean downloads, the dataset CSV) are compressed
+# chunk by chunk as they are sent instead of being read into memory
+COMPRESS_IN_MEMORY_MAX_BYTES = 1024 * 1024
+# Compressed static assets (static/, Dash assets and component suites) kept per worker
+COMPRESSED_ASSETS_MAX_BYTES = 8 * 1024 * 1024
+
+_fingerprints = {}
+_compressed_assets = {'bytes': 0, 'bodies': {}}
+_manifest = {'mtime': None, 'images': {}}
+
+
+def asset_fingerprint(filename):
+    path = os.path.join(STATIC_FOLDER, filename)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    stamp = (stat.st_size, stat.st_mtime_ns)
+    cached = _fingerprints.get(filename)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    with open(path, 'rb') as f:
+        fingerprint = hashlib.sha1(f.read()).hexdigest()[:10]
+    _fingerprints[filename] = (stamp, fingerprint)
+    return fingerprint
+
+
+def asset_url(filename):
+    # The content hash in the query string changes whenever the file does,
+    # so the response can be cached forever (see add_cache_headers)
+    fingerprint = asset_fingerprint(filename)
+    if fingerprint is None:
+        return url_for('static', filename=filename)
+    return url_for('static', filename=filename, v=fingerprint)
+
+
+def _load_manifest():
+    try:
+        mtime = os.path.getmtime(VARIANTS_MANIFEST)
+    except FileNotFoundError:
+        return {}
+    if mtime != _manifest['mtime']:
+        with open(VARIANTS_MANIFEST) as f:
+            _manifest['images'] = json.load(f)
+        _manifest['mtime'] = mtime
+    return _manifest['images']
+
+
+def responsive_image(filename, alt, sizes='100vw', **attrs):
+    """
+    Render a <picture> with AVIF/WebP srcsets from the variants build, falling back
+    to the original file. Without a build (or for an image the build has not seen
+    yet) this is a plain <img> with a fingerprinted URL.
+    """
+    img_attrs = ''.join(f' {escape(name.rstrip("_"))}="{escape(value)}"' for name, value in attrs.items())
+    img = Markup(f'<img alt="{escape(alt)}" src="{escape(asset_url(filename))}" loading="lazy" decoding="async"{img_attrs}/>')
+
+    entry = _load_manifest().get(filename)
+    if not entry or entry.get('source_fingerprint') != asset_fingerprint(filename):
+        return img
+
+    sources = ''
+    for fmt, mimetype, _ in VARIANT_FORMATS:
+        variants = entry['variants'].get(fmt)
+        if variants:
+            srcset = ', '.join(f'{asset_url(path)} {width}w' for width, path in variants)
+            sources += f'<source type="{mimetype}" srcset="{escape(srcset)}" sizes="{escape(sizes)}"/>'
+    # display: contents keeps the <img> laid out as if it were not wrapped
+    return Markup(f'<picture style="display: contents;">{sources}{img}</picture>')
+
+
+def _preferred_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted.quality('br') > 0:
+        return 'br'
+    if accepted.quality('gzip') > 0:
+        return 'gzip'
+    return None
+
+
+def _compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    buffer = io.BytesIO()
+    with gzip.GzipFile(mode='wb', compresslevel=GZIP_LEVEL, fileobj=buffer, mtime=0) as f:
+        f.write(data)
+    return buffer.getvalue()
+
+
+def _compress_stream(chunks, encoding):
+    # Flushed after every chunk, so each batch still reaches the client as soon as it is produced
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        compress, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        compress, flush, finish = compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+    try:
+        for chunk in chunks:
+            data = compress(chunk.encode() if isinstance(chunk, str) else chunk) + flush()
+            if data:
+                yield data
+        yield finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def _asset_cache_key(response, encoding):
+    # Static assets only: files from static/ and Dash assets by their ETag, Dash
+    # component suites by their fingerprinted path. Downloads are never kept.
+    etag, _ = response.get_etag()
+    endpoint = request.endpoint or ''
+    if response.direct_passthrough and etag and (endpoint == 'static' or endpoint.endswith('_dash_assets.static')):
+        return etag, encoding
+    if '/_dash-component-suites/' in request.path:
+        return request.path, encoding
+    return None
+
+
+def _remember_asset(key, compressed):
+    cache = _compressed_assets
+    if len(compressed) > COMPRESSED_ASSETS_MAX_BYTES:
+        return
+    # Oldest first, until the new body fits
+    while cache['bytes'] + len(compressed) > COMPRESSED_ASSETS_MAX_BYTES:
+        oldest = next(iter(cache['bodies']))
+        cache['bytes'] -= len(cache['bodies'].pop(oldest))
+    cache['bodies'][key] = compressed
+    cache['bytes'] += len(compressed)
+
+
+def _encode_streamed(response, encoding):
+    response.response = _compress_stream(response.response, encoding)
+    response.direct_passthrough = False
+    response.headers.pop('Content-Length', None)
+    response.headers.pop('Accept-Ranges', None)
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f'{etag}-{encoding}', weak)
+    return response
+
+
+def compress_response(response):
+    """
+    Compress a response for clients that accept it. Generated streams (the NDJSON
+    records API) and files over COMPRESS_IN_MEMORY_MAX_BYTES are compressed chunk by
+    chunk as they are sent. Smaller files and bodies are compressed in full; static
+    assets are compressed once and served from a per-worker cache bounded by
+    COMPRESSED_ASSETS_MAX_BYTES.
+    """
+    if response.status_code != 200 or 'Content-Encoding' in response.headers \
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+
+    encoding = _preferred_encoding()
+    if encoding is None:
+        return response
+
+    if response.is_streamed and not response.direct_passthrough:
+        return _encode_streamed(response, encoding)
+    if response.direct_passthrough and (response.content_length or 0) > COMPRESS_IN_MEMORY_MAX_BYTES:
+        return _encode_streamed(response, encoding)
+
+    etag, weak = response.get_etag()
+    cache_key = _asset_cache_key(response, encoding)
+    compressed = _compressed_assets['bodies'].get(cache_key) if cache_key else None
+    if compressed is None:
+        # Files from send_file are passed through unread by default
+        response.direct_passthrough = False
+        data = response.get_data()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return response
+        compressed = _compress(data, encoding)
+        if cache_key:
+            _remember_asset(cache_key, compressed)
+    else:
+        response.close()
+        response.direct_passthrough = False
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    response.headers.pop('Accept-Ranges', None)
+    response.vary.add('Accept-Encoding')
+    if etag:
+        response.set_etag(f'{etag}-{encoding}', weak)
+        # Revalidations carry the encoded ETag, which send_file itself never matches
+        response.make_conditional(request)
+    return response
+
+
+def add_cache_headers(response):
+    if request.endpoint == 'static' and request.args.get('v') and response.status_code in (200, 304):
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+        response.cache_control.no_cache = None
+    return response
+
+
+def init_static_assets(app):
+    app.jinja_env.globals['asset_url'] = asset_url
+    app.jinja_env.globals['responsive_image'] = responsive_image
+
+    @app.after_request
+    def optimize_response(response):
+        return compress_response(add_cache_headers(response))
+
+
+def build_image_variants():
+    """
+    Build step: write resized AVIF/WebP copies of every image in static/ into
+    static/variants/ and record them in manifest.json. Images whose content has not
+    changed since the last build are skipped. Requires Pillow.
+    """
+    from PIL import Image, features
+
+    os.makedirs(VARIANTS_FOLDER, exist_ok=True)
+    manifest = _load_manifest()
+    formats = [(fmt, mimetype, quality) for fmt, mimetype, quality in VARIANT_FORMATS if features.check(fmt)]
+    for fmt, _, _ in VARIANT_FORMATS:
+        if not features.check(fmt):
+            print(f"Pillow has no {fmt} support; skipping {fmt} variants.")
+
+    for filename in sorted(os.listdir(STATIC_FOLDER)):
+        if os.path.splitext(filename)[1].lower() not in IMAGE_EXTENSIONS:
+            continue
+        fingerprint = asset_fingerprint(filename)
+        if manifest.get(filename, {}).get('source_fingerprint') == fingerprint:
+            continue
+
+        with Image.open(os.path.join(STATIC_FOLDER, filename)) as image:
+            image.load()
+            widths = [width for width in VARIANT_WIDTHS if width < image.width] + [image.width]
+            stem = os.path.splitext(filename)[0].replace(' ', '_')
+            variants = {}
+            for fmt, _, quality in formats:
+                variants[fmt] = []
+                for width in widths:
+                    height = round(image.height * width / image.width)
+                    resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+                    variant_path = f'variants/{stem}-{width}.{fmt}'
+                    resized.save(os.path.join(STATIC_FOLDER, variant_path), fmt.upper(), quality=quality)
+                    variants[fmt].append([width, variant_path])
+
+        manifest[filename] = {'source_fingerprint': fingerprint, 'width': image.width, 'variants': variants}
+        original_size = os.path.getsize(os.path.join(STATIC_FOLDER, filename))
+        smallest = min((os.path.getsize(os.path.join(STATIC_FOLDER, path)) for paths in variants.values() for _, path in paths), default=original_size)
+        print(f"{filename}: {original_size // 1024} KB -> smallest variant {smallest // 1024} KB")
+
+    with open(VARIANTS_MANIFEST, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+if __name__ == "__main__":
+    build_image_variants()
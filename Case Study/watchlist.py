@@ -0,0 +1,174 @@
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from dataset_store import current_version, load_dataset_version, get_active_version, get_previous_version, get_version_directory
+
+# Watchlist rules are configuration, not code. Each enabled rule is evaluated once per
+# dataset version over the whole enrollment matrix; the resulting row bitsets are saved
+# next to that version and the report only intersects them with the active filter.
+WATCHLIST_RULES_PATH = os.path.join(os.path.dirname(__file__), 'watchlist_rules.json')
+
+# Pseudo-columns every rule can refer to besides the dataset's own columns
+DERIVED_COLUMNS = ['Total', 'Total Male', 'Total Female']
+
+# Rules describe schools, not grades: the report's grade filter narrows the charts but
+# not the watchlist, so a school flagged for "K Male" still appears with G3 selected
+# (with its K Male value shown next to the reason, see rule_columns).
+
+_cache = {'key': None, 'rule_ids': [], 'labels': [], 'hits': np.zeros((0, 0), dtype=bool)}
+
+
+def load_watchlist_rules():
+    try:
+        with open(WATCHLIST_RULES_PATH) as f:
+            rules = json.load(f)
+    except FileNotFoundError:
+        return []
+    return [rule for rule in rules if rule.get('enabled', True)]
+
+
+def rule_columns(rules=None):
+    """Dataset columns the enabled rules read, so the watchlist can show the values behind a flag."""
+    columns = []
+    for rule in load_watchlist_rules() if rules is None else rules:
+        column = rule.get('column')
+        if column and column not in DERIVED_COLUMNS and column not in columns:
+            columns.append(column)
+    return columns
+
+
+def _rules_fingerprint(rules):
+    return hashlib.sha1(json.dumps(rules, sort_keys=True).encode()).hexdigest()[:10]
+
+
+def _enrollment_totals(df):
+    enrollment_cols = [col for col in df.columns if col.endswith((' Male', ' Female')) and pd.api.types.is_numeric_dtype(df[col])]
+    matrix = df[enrollment_cols].to_numpy(dtype='float64')
+    male = np.array([col.endswith(' Male') for col in enrollment_cols])
+    return pd.DataFrame({
+        'Total': matrix.sum(axis=1),
+        'Total Male': matrix[:, male].sum(axis=1),
+        'Total Female': matrix[:, ~male].sum(axis=1),
+    }, index=df.index)
+
+
+def _rule_values(df, totals, column):
+    if column in DERIVED_COLUMNS:
+        return totals[column]
+    if column not in df.columns:
+        raise ValueError(f"Watchlist rule refers to unknown column: {column}")
+    return pd.to_numeric(df[column], errors='coerce')
+
+
+def evaluate_watchlist_rules(df, rules, previous_df=None):
+    """
+    Return a (rules x rows) boolean matrix, one vectorized mask per rule.
+    Rule types:
+      threshold         column op value, e.g. {"column": "K Male", "op": "<", "value": 10}
+      division_zscore   |z| of column within its Division above max_abs_z
+      version_drop      school total fell by at least min_drop_share since the previous version
+      gender_imbalance  male share of the total outside [1 - max_share, max_share]
+    """
+    totals = _enrollment_totals(df)
+    hits = np.zeros((len(rules), len(df)), dtype=bool)
+
+    for i, rule in enumerate(rules):
+        kind = rule['type']
+        if kind == 'threshold':
+            values = _rule_values(df, totals, rule['column'])
+            ops = {'<': values.lt, '<=': values.le, '>': values.gt, '>=': values.ge, '=': values.eq, '!=': values.ne}
+            mask = ops[rule['op']](rule['value'])
+
+        elif kind == 'division_zscore':
+            if 'Division' not in df.columns:
+                raise ValueError(f"Watchlist rule {rule['id']} needs a Division column")
+            values = _rule_values(df, totals, rule.get('column', 'Total'))
+            groups = values.groupby(df['Division'].to_numpy())
+            z = (values - groups.transform('mean')) / groups.transform('std')
+            mask = z.abs() > rule.get('max_abs_z', 3)
+
+        elif kind == 'version_drop':
+            if previous_df is None or 'BEIS School ID' not in df.columns or 'BEIS School ID' not in previous_df.columns:
+                continue
+            previous_totals = _enrollment_totals(previous_df)['Total']
+            previous_totals = previous_totals.groupby(previous_df['BEIS School ID'].to_numpy()).sum()
+            before = pd.Series(df['BEIS School ID'].map(previous_totals).to_numpy(dtype='float64'), index=df.index)
+            drop_share = (before - totals['Total']) / before
+            mask = (before >= rule.get('min_previous_total', 20)) & (drop_share >= rule.get('min_drop_share', 0.5))
+
+        elif kind == 'gender_imbalance':
+            male_share = totals['Total Male'] / totals['Total']
+            max_share = rule.get('max_share', 0.75)
+            mask = (totals['Total'] >= rule.get('min_total', 20)) & ((male_share > max_share) | (male_share < 1 - max_share))
+
+        else:
+            raise ValueError(f"Unknown watchlist rule type: {kind}")
+
+        hits[i] = mask.fillna(False).to_numpy(dtype=bool)
+    return hits
+
+
+def build_watchlist_bitsets(version=None):
+    """
+    Evaluate the configured rules for a dataset version and save the packed bitsets as
+    dataset_store/<version>/watchlist_<rules fingerprint>.npz. Run at ingest; the report
+    falls back to building them on first use.
+    """
+    version = version or get_active_version()
+    rules = load_watchlist_rules()
+    path = os.path.join(get_version_directory(version), f'watchlist_{_rules_fingerprint(rules)}.npz')
+    if os.path.exists(path):
+        return path
+
+    df = load_dataset_version(version)
+    previous_df = load_dataset_version(get_previous_version(version))
+    hits = evaluate_watchlist_rules(df, rules, previous_df)
+
+    temp_path = f'{path}.{os.getpid()}.npz'
+    np.savez(temp_path, bits=np.packbits(hits, axis=1), rows=len(df),
+             rule_ids=np.array([rule['id'] for rule in rules], dtype=str),
+             labels=np.array([rule.get('label', rule['id']) for rule in rules], dtype=str))
+    os.replace(temp_path, path)
+    return path
+
+
+def _load_hits():
+    version = current_version()
+    if version is None:
+        return np.zeros((0, 0), dtype=bool), []
+    rules = load_watchlist_rules()
+    key = (version, _rules_fingerprint(rules))
+    if key != _cache['key']:
+        try:
+            path = build_watchlist_bitsets(version)
+        except Exception as e:
+            # A rule that cannot run on this dataset leaves the report without a watchlist, not broken
+            print(f"Watchlist rules could not be evaluated for version {version}: {e}")
+            path = None
+        if path is None:
+            _cache['hits'], _cache['rule_ids'], _cache['labels'] = np.zeros((0, 0), dtype=bool), [], []
+        else:
+            with np.load(path) as saved:
+                rows = int(saved['rows'])
+                _cache['hits'] = np.unpackbits(saved['bits'], axis=1, count=rows).astype(bool) if rows else np.zeros((len(saved['labels']), 0), dtype=bool)
+                _cache['rule_ids'] = list(saved['rule_ids'])
+                _cache['labels'] = list(saved['labels'])
+        _cache['key'] = key
+    return _cache['hits'], _cache['labels']
+
+
+def flagged_rows(filter_positions):
+    """
+    Intersect the stored bitsets with the rows matching the active filter.
+    Returns the flagged row positions and, for each, the labels of the rules it broke.
+    """
+    hits, labels = _load_hits()
+    if not labels:
+        return np.array([], dtype=int), []
+
+    selected = hits[:, filter_positions]
+    flagged = selected.any(axis=0)
+    reasons = ['; '.join(label for label, hit in zip(labels, column) if hit) for column in selected[:, flagged].T]
+    return np.asarray(filter_positions)[flagged], reasons
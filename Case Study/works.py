@@ -2,12 +2,16 @@ from flask import Flask, render_template_string
 from dash import Dash, dcc, html, Input, Output, dash_table
 import plotly.express as px
 import pandas as pd
-from data_config import get_dataset_path
+from dataset_backend import get_backend
+from single_flight import single_flight
+from rollups import get_rollup, get_column_totals
 
 # Flask server
 server = Flask(__name__)
 
 def create_dash_app(server, url_base_pathname='/dashenrollment/'):
+    backend = get_backend()
+
     dash_app_works = Dash(
         __name__,
         server=server,
@@ -64,18 +68,18 @@ def create_dash_app(server, url_base_pathname='/dashenrollment/'):
         Output('region-dropdown', 'options'),
         Input('region-dropdown', 'id')  # dummy input
     )
+    @single_flight('works.populate_regions')
     def populate_regions(_):
-        df = pd.read_csv(get_dataset_path())
-        return [{'label': region, 'value': region} for region in sorted(df['Region'].dropna().unique())]
+        return [{'label': region, 'value': region} for region in sorted(region for region in backend.distinct('Region') if pd.notna(region))]
 
     @dash_app_works.callback(
         Output('school-dropdown', 'options'),
         Input('region-dropdown', 'value')
     )
+    @single_flight('works.update_schools')
     def update_schools(region):
-        df = pd.read_csv(get_dataset_path())
-        filtered_df = df if not region else df[df['Region'] == region]
-        return [{'label': school, 'value': school} for school in filtered_df['School Name'].unique()]
+        filters = {'Region': region} if region else None
+        return [{'label': school, 'value': school} for school in backend.distinct('School Name', filters)]
 
     @dash_app_works.callback(
         [Output('school-table', 'data'),
@@ -85,16 +89,16 @@ def create_dash_app(server, url_base_pathname='/dashenrollment/'):
          Output('enrollment-line-chart', 'figure')],
         Input('school-dropdown', 'value')
     )
+    @single_flight('works.update_dashboard')
     def update_dashboard(selected_school):
-        df = pd.read_csv(get_dataset_path())
         if not selected_school:
             empty_fig = px.bar(title='Select a school to view enrollment')
             return [], empty_fig, "", px.pie(title=''), px.line(title='')
 
-        school_df = df[df['School Name'] == selected_school]
+        school_df = backend.rows({'School Name': selected_school})
         table_data = school_df[["School Name", "Region", "Province", "Municipality"]].to_dict('records')
 
-        grade_cols = [col for col in df.columns if col.startswith(('K ', 'G'))]
+        grade_cols = [col for col in school_df.columns if col.startswith(('K ', 'G'))]
         enrollment_sums = school_df[grade_cols].sum()
 
         # Bar chart
@@ -144,13 +148,22 @@ def create_dash_app(server, url_base_pathname='/dashenrollment/'):
         Output('summary-stats', 'children'),
         Input('region-dropdown', 'value')
     )
+    @single_flight('works.update_summary')
     def update_summary(region):
-        df = pd.read_csv(get_dataset_path())
-        if region:
-            df = df[df['Region'] == region]
-        total_schools = df['School Name'].nunique()
-        grade_cols = [col for col in df.columns if col.startswith(('K ', 'G'))]
-        avg_enrollment = df[grade_cols].sum(axis=1).mean()
+        filters = {'Region': region} if region else None
+        grade_cols = [col for col in backend.columns() if col.startswith(('K ', 'G'))]
+        # Mean of the per-school totals, from the column totals and the row count;
+        # both come precomputed from the rollups for the active dataset version
+        rollup = get_rollup(filters)
+        totals = get_column_totals(filters, grade_cols)
+        if rollup is not None and totals is not None:
+            total_schools = rollup['stats']['school_names']
+            row_count = rollup['stats']['rows']
+        else:
+            total_schools = backend.nunique('School Name', filters)
+            row_count = backend.count(filters)
+            totals = backend.column_totals(filters, grade_cols)
+        avg_enrollment = totals.sum() / row_count if row_count else float('nan')
 
         return f"Total Schools: {total_schools} | Average Enrollment: {int(avg_enrollment)}"
 